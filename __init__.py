@@ -1,13 +1,23 @@
+import os
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 # Initialize SQLAlchemy so it can be used by other files
 db = SQLAlchemy()
 
 
-def create_app():
-    """Constructs the core Flask application."""
+def create_app(model_warm_up='background', proxy_hops=None):
+    """
+    Constructs the core Flask application.
+    model_warm_up: 'background' loads the AI model on a daemon thread so the server boots
+    immediately, 'eager' blocks until it is loaded and warmed up, 'preload' loads the weights
+    without running them (pre-fork servers, see serve.py), 'lazy' waits for the first upload.
+    proxy_hops: reverse proxies in front of the app (default: COIN_PROXY_HOPS, else 0). Their
+    X-Forwarded-For entries are trusted, so rate limits key on the real client address.
+    """
     # We add template_folder and static_folder arguments to point to the correct locations
     app = Flask(__name__,
                 instance_relative_config=True,
@@ -29,6 +39,17 @@ def create_app():
     )
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # Refuse oversized bodies before they are parsed (per-endpoint limits are in admission.py)
+    from .admission import MAX_REQUEST_BYTES
+    app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+
+    # Behind nginx & co. request.remote_addr is the proxy; take the client from X-Forwarded-For.
+    # Only as many hops as are really there, or clients could spoof their address.
+    if proxy_hops is None:
+        proxy_hops = int(os.environ.get('COIN_PROXY_HOPS', 0))
+    if proxy_hops > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops, x_proto=proxy_hops, x_host=proxy_hops)
+
     # Initialize extensions
     CORS(app)  # Enable Cross-Origin Resource Sharing
     db.init_app(app)  # Connect the database to this Flask app instance
@@ -38,11 +59,34 @@ def create_app():
         from . import routes
         app.register_blueprint(routes.bp)
 
+        # Load the AI model off the request/import path (see model_warm_up above)
+        if model_warm_up == 'preload':
+            routes.preload_predictor()
+        elif model_warm_up != 'lazy':
+            routes.warm_up_predictor(background=(model_warm_up == 'background'))
+
+        # Pick up background jobs queued before a restart. Pre-fork servers do this per worker
+        # (serve.py): threads started here would not survive the fork.
+        if model_warm_up != 'preload':
+            from .jobs import job_queue
+            job_queue.resume()
+
         # Import the database models
         from . import models
 
         # This command creates the database tables if they don't already exist
         db.create_all()
 
+        # Cache which catalogue tables exist so searches don't inspect the schema per request
+        from . import search
+        search.refresh_table_cache()
+
+        # Load the catalogue into the in-process full-text index used by /api/search
+        search.build_fulltext_index()
+
+        # Scan the coin image folders once; lookups then only poll folder mtimes
+        from .image_finder import image_index
+        image_index.refresh()
+
         return app
 
@@ -0,0 +1,213 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from io import BytesIO
+
+from PIL import Image
+
+from .metrics import registry
+
+# --- Concurrency gates (per process) ---
+INFERENCE_BATCHES_IN_FLIGHT = 2  # Micro-batches' worth of uploads decoding / queued for the model at once
+INFERENCE_MAX_WAIT = 2.0         # Seconds an upload may queue for a slot before getting a 503
+ENRICHMENT_CONCURRENCY = 4       # Synchronous web searches at once
+ENRICHMENT_MAX_WAIT = 1.0        # After this, web enrichment falls back to a background job
+
+# --- Upload limits, checked before the image is decoded ---
+MAX_UPLOAD_BYTES = 15 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000    # ~ a 7700 x 5200 photo
+MAX_REQUEST_BYTES = 256 * 1024 * 1024  # Any request body (batch uploads included); Flask answers 413 above this
+
+# --- Per-client rate limit for the identify endpoints (overridable from the environment) ---
+IDENTIFY_RATE_PER_MINUTE = float(os.environ.get("COIN_IDENTIFY_RATE_PER_MINUTE", 30))
+IDENTIFY_BURST = float(os.environ.get("COIN_IDENTIFY_BURST", 10))
+RATE_LIMIT_MAX_CLIENTS = 10000   # Buckets kept in memory; the least recently seen are dropped first
+# Client addresses never rate-limited, comma-separated (e.g. "127.0.0.1,::1" for local load tests).
+# Behind a reverse proxy, only list loopback once ProxyFix is on, or every proxied client is exempt.
+RATE_LIMIT_EXEMPT = frozenset(
+    addr.strip() for addr in os.environ.get("COIN_RATE_LIMIT_EXEMPT", "").split(",") if addr.strip())
+
+ADMISSION_REJECTED = registry.counter(
+    "coin_admission_rejected_total", "Requests turned away by admission control.", ["gate", "reason"])
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    "coin_admission_wait_seconds", "Time spent queueing for an admission slot.", ["gate"])
+
+_DEFAULT = object()
+
+
+class AdmissionError(Exception):
+    """A request refused before doing the work; rendered as JSON with `status` and an optional Retry-After."""
+
+    def __init__(self, message, status=503, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """
+    Bounded admission in front of an expensive stage.
+
+    At most `limit` callers run at once. Others queue for up to `max_wait`
+    seconds and are then refused (503) instead of piling up behind work that
+    will finish after their client has given up; at most `max_waiting` may
+    queue at all. Admitted requests therefore see bounded latency under
+    overload. Retry-After is estimated from the recent time each slot is held.
+    """
+
+    def __init__(self, name, limit, max_wait, max_waiting=None):
+        self.name = name
+        self.limit = limit
+        self.max_wait = max_wait
+        self.max_waiting = limit * 4 if max_waiting is None else max_waiting
+
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._avg_hold = 1.0  # seconds, exponentially weighted
+
+    def retry_after(self):
+        with self._lock:
+            backlog = self._waiting / self.limit + 1
+            return max(1, math.ceil(self._avg_hold * backlog))
+
+    def _reject(self, reason):
+        ADMISSION_REJECTED.inc(gate=self.name, reason=reason)
+        raise AdmissionError("The server is busy; please retry shortly.", status=503,
+                             retry_after=self.retry_after())
+
+    @contextmanager
+    def admit(self, max_wait=_DEFAULT):
+        """
+        Holds a slot for the duration of the block, raising AdmissionError if
+        none frees up within `max_wait` (None waits indefinitely, e.g. for work
+        already streaming to a client).
+        """
+        wait = self.max_wait if max_wait is _DEFAULT else max_wait
+        start = time.perf_counter()
+        with self._lock:
+            if wait is not None and self._waiting >= self.max_waiting:
+                queue_full = True
+            else:
+                queue_full = False
+                self._waiting += 1
+        if queue_full:
+            self._reject("queue_full")
+
+        try:
+            acquired = self._slots.acquire(timeout=wait)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start, gate=self.name)
+        if not acquired:
+            self._reject("timeout")
+
+        held_from = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._slots.release()
+            held = time.perf_counter() - held_from
+            with self._lock:
+                self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+
+
+class TokenBucketLimiter:
+    """
+    Per-client token buckets kept in memory: `rate_per_minute` sustained,
+    bursts up to `burst`. A request costing more than `burst` (a large batch)
+    is let through once the bucket is full and leaves it in debt, so the
+    client then waits until the whole cost has been refilled. Clients in
+    `exempt` are never limited.
+    """
+
+    def __init__(self, name, rate_per_minute, burst, max_clients=RATE_LIMIT_MAX_CLIENTS, exempt=()):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+        self.exempt = frozenset(exempt)
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # client -> (tokens, last update); least recently seen first
+
+    def check(self, client, cost=1, prepaid=0):
+        """
+        Takes `cost` tokens from the client's bucket or raises AdmissionError (429).
+        `prepaid` tokens of the cost were already taken by an earlier check for
+        the same request (e.g. before its body was parsed); the request is
+        judged as if the whole cost were charged at once.
+        """
+        if client in self.exempt or cost <= prepaid:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            needed = min(cost, self.burst) - prepaid
+            allowed = tokens >= needed
+            if allowed:
+                tokens -= cost - prepaid
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+
+        if not allowed:
+            ADMISSION_REJECTED.inc(gate=self.name, reason="rate_limited")
+            raise AdmissionError("Too many requests; please slow down.", status=429,
+                                 retry_after=max(1, math.ceil((needed - tokens) / self.rate)))
+
+
+def upload_too_large():
+    return AdmissionError(f"Upload is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.", status=413)
+
+
+def check_upload_size(content_length):
+    """Rejects a request body larger than MAX_UPLOAD_BYTES from its declared length, before reading it."""
+    if content_length is not None and content_length > MAX_UPLOAD_BYTES:
+        raise upload_too_large()
+
+
+def read_limited(stream):
+    """Reads an uploaded file, refusing to buffer more than MAX_UPLOAD_BYTES (for bodies without a length)."""
+    data = stream.read(MAX_UPLOAD_BYTES + 1)
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise upload_too_large()
+    return data
+
+
+def check_image_pixels(image_bytes):
+    """
+    Rejects images over MAX_IMAGE_PIXELS using only the header (Image.open is
+    lazy), so a small file that decompresses to a huge bitmap is never decoded.
+    Unreadable images pass through; the predictor reports those.
+    """
+    try:
+        with Image.open(BytesIO(image_bytes)) as img:
+            width, height = img.size
+    except Exception:
+        return
+    if width * height > MAX_IMAGE_PIXELS:
+        raise AdmissionError(f"Image is {width}x{height}; at most {MAX_IMAGE_PIXELS // 1_000_000} megapixels "
+                             f"are accepted.", status=413)
+
+
+def inference_concurrency(max_batch_size):
+    """Uploads admitted at once: enough to fill one micro-batch while the previous one runs."""
+    return max_batch_size * INFERENCE_BATCHES_IN_FLIGHT
+
+
+def configure_inference(max_batch_size):
+    """Sizes the inference gate to the predictor's micro-batches; call before serving uploads."""
+    global inference_limiter
+    inference_limiter = ConcurrencyLimiter("inference", inference_concurrency(max_batch_size), INFERENCE_MAX_WAIT)
+
+
+inference_limiter = ConcurrencyLimiter("inference", inference_concurrency(16), INFERENCE_MAX_WAIT)
+enrichment_limiter = ConcurrencyLimiter("enrichment", ENRICHMENT_CONCURRENCY, ENRICHMENT_MAX_WAIT)
+identify_rate_limiter = TokenBucketLimiter("identify_rate", IDENTIFY_RATE_PER_MINUTE, IDENTIFY_BURST,
+                                           exempt=RATE_LIMIT_EXEMPT)
@@ -0,0 +1,79 @@
+"""
+Benchmark: direct Predictor.predict vs. the BatchingPredictor micro-batcher.
+
+Fires N concurrent uploads at each concurrency level and reports p50/p99
+latency and images/sec. Run from the project root (next to run.py):
+
+    python benchmarks/bench_batching.py --requests 256 --concurrency 1 4 8 16 32
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_model.predictor import Predictor, BatchingPredictor  # noqa: E402
+
+
+def make_jpegs(count, size=(1024, 768), seed=0):
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        arr = rng.integers(0, 255, size=(size[1], size[0], 3), dtype=np.uint8)
+        buf = BytesIO()
+        Image.fromarray(arr).save(buf, format="JPEG", quality=85)
+        images.append(buf.getvalue())
+    return images
+
+
+def run(predict_fn, images, concurrency, total):
+    latencies = []
+
+    def one(i):
+        t0 = time.perf_counter()
+        result = predict_fn(images[i % len(images)])
+        latencies.append(time.perf_counter() - t0)
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    lat_ms = np.array(latencies) * 1000
+    return np.percentile(lat_ms, 50), np.percentile(lat_ms, 99), total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    predictor = Predictor()
+    batcher = BatchingPredictor(predictor, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    images = make_jpegs(16)
+
+    # Warm up both paths so one-off allocations don't skew the first row
+    predictor.predict(images[0])
+    batcher.predict(images[0])
+
+    print(f"{'mode':<10}{'conc':>6}{'p50 ms':>10}{'p99 ms':>10}{'img/s':>10}")
+    for concurrency in args.concurrency:
+        for mode, fn in (("direct", predictor.predict), ("batched", batcher.predict)):
+            p50, p99, rate = run(fn, images, concurrency, args.requests)
+            print(f"{mode:<10}{concurrency:>6}{p50:>10.1f}{p99:>10.1f}{rate:>10.1f}")
+
+    batcher.close()
+
+
+if __name__ == "__main__":
+    main()
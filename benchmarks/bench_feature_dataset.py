@@ -0,0 +1,68 @@
+"""
+Benchmark: samples/sec reading training features, per-file .pt vs. packed shards.
+
+Writes a synthetic ProtoFeatureDataset folder (<class>/<sample>.pt, one
+[128, 4, 4] tensor per file) into a temp dir, packs it with
+pack_feature_shards, then times a shuffled DataLoader epoch over each layout
+at several worker counts. Run from the project root (next to run.py):
+
+    python benchmarks/bench_feature_dataset.py --samples 20000 --workers 0 2 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import torch
+from torch.utils.data import DataLoader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_model.coin_classifier import ProtoFeatureDataset  # noqa: E402
+from ai_model.feature_shards import ShardedFeatureDataset, pack_feature_shards  # noqa: E402
+
+
+def make_feature_folder(root, samples, classes, shape):
+    for c in range(classes):
+        os.makedirs(os.path.join(root, f"class_{c:02d}"), exist_ok=True)
+    for i in range(samples):
+        torch.save(torch.randn(shape), os.path.join(root, f"class_{i % classes:02d}", f"{i:07d}.pt"))
+
+
+def epoch(dataset, workers, batch_size):
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=workers,
+                        persistent_workers=False)
+    start = time.perf_counter()
+    seen = 0
+    for x, _ in loader:
+        seen += x.shape[0]
+    return seen / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--classes", type=int, default=39)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--shard-size", type=int, default=8192)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files_dir = os.path.join(tmp, "files")
+        shards_dir = os.path.join(tmp, "shards")
+        make_feature_folder(files_dir, args.samples, args.classes, (128, 4, 4))
+        pack_feature_shards(files_dir, shards_dir, shard_size=args.shard_size)
+
+        datasets = (("per-file .pt", ProtoFeatureDataset(files_dir)),
+                    ("shards fp16", ShardedFeatureDataset(shards_dir)))
+        print(f"\n{'layout':<16}{'workers':>8}{'samples/s':>12}")
+        for name, dataset in datasets:
+            for workers in args.workers:
+                rate = epoch(dataset, workers, args.batch_size)
+                print(f"{name:<16}{workers:>8}{rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: a fresh requests.Session per URL (old scraper behaviour) vs. the
+shared keep-alive pool from utils.get_session().
+
+Starts a local stub HTTP/1.1 server, fetches the same set of pages with both
+strategies from a thread pool, and reports new TCP connections and total time.
+Run from the project root (next to run.py):
+
+    python benchmarks/bench_http_pool.py --requests 400 --workers 8
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils import http_get, load_random_headers  # noqa: E402
+
+PAGE = ("<html><head><title>Kushan gold dinar</title></head><body><article>"
+        + "<p>Obverse: king standing at altar. Reverse: deity with nimbus.</p>" * 200
+        + "</article></body></html>").encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StubHandler.lock:
+            StubHandler.connections += 1
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+def fetch_new_session(url):
+    with requests.Session() as s:
+        resp = s.get(url, headers=load_random_headers(), timeout=10)
+        resp.raise_for_status()
+        return len(resp.content)
+
+
+def fetch_pooled(url):
+    resp = http_get(url, timeout=10)
+    resp.raise_for_status()
+    return len(resp.content)
+
+
+def run(fetch, urls, workers):
+    StubHandler.connections = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(fetch, urls))
+    return StubHandler.connections, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base}/page/{i}" for i in range(args.requests)]
+
+    print(f"{'strategy':<14}{'connections':>12}{'total s':>10}{'ms/fetch':>10}")
+    for name, fetch in (("session/url", fetch_new_session), ("pooled", fetch_pooled)):
+        connections, elapsed = run(fetch, urls, args.workers)
+        print(f"{name:<14}{connections:>12}{elapsed:>10.2f}{elapsed * 1000 / len(urls):>10.2f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark: CPU time and peak memory per page, BeautifulSoup extraction (old
+fetch_page) vs. the streaming extractor in scraper._extract_chunks.
+
+Pages come from --pages (a directory of saved .html files, e.g. fetched with
+`curl -o`) or, by default, synthetic archive pages of increasing size with
+navigation, scripts and an article. Each page is fed to the new extractor in
+64 KiB chunks, as it would arrive from the network. CPU time is the median of
+--repeat runs; peak memory is measured with tracemalloc in a separate run.
+Run from the project root (next to run.py):
+
+    python benchmarks/bench_page_extraction.py [--pages saved_pages/] [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup, Comment
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.scraper import STREAM_CHUNK_BYTES, _extract_chunks  # noqa: E402
+from src.utils import clean_text  # noqa: E402
+
+NAV = "<nav><ul>" + "".join(f"<li><a href='/p/{i}'>Archive page {i}</a></li>" for i in range(200)) + "</ul></nav>"
+SCRIPT = "<script>" + "var tracking = {id: 1, events: []};" * 200 + "</script>"
+PARAGRAPH = ("<p>The obverse shows the Kushan king Kanishka standing at an altar; the reverse shows a deity "
+             "with nimbus. Gold dinar, <a href='/mint'>Bactrian mint</a>, c. 127-150 CE.</p>")
+
+
+def synthetic_page(paragraphs):
+    return (f"<!doctype html><html><head><meta charset='utf-8'><title>Coin archive</title>{SCRIPT}</head>"
+            f"<body><header>{NAV}</header><div id='content'><aside>{NAV}</aside><article>"
+            + PARAGRAPH * paragraphs + f"</article></div><footer>{NAV}</footer>{SCRIPT}</body></html>").encode()
+
+
+def minified_page(paragraphs):
+    """No </head>, </p> or </body>: optional in HTML5 and commonly dropped by minifiers."""
+    return ("<!doctype html><html><head><meta charset=utf-8><title>Coin archive</title>" + SCRIPT
+            + "<body>" + NAV + "<main>" + PARAGRAPH.replace("</p>", "") * paragraphs + "</main>").encode()
+
+
+def load_pages(directory):
+    if not directory:
+        return ([(f"synthetic-{n}p", synthetic_page(n)) for n in (50, 500, 5000, 50000)]
+                + [("minified-500p", minified_page(500))])
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith((".html", ".htm")):
+            with open(os.path.join(directory, name), "rb") as f:
+                pages.append((name, f.read()))
+    return pages
+
+
+def legacy_extract(body):
+    """fetch_page before streaming: decode everything, build a full tree, decompose, select."""
+    html = body.decode("utf-8", errors="replace")
+    soup = BeautifulSoup(html, "html.parser")
+    title = clean_text(soup.title.string) if soup.title and soup.title.string else ""
+    for element in soup(["script", "style", "header", "footer", "nav", "aside", "form", "button"]):
+        element.decompose()
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.extract()
+    content_div = None
+    for selector in ["article", "main", ".post-content", ".entry-content", "#content", "#main", ".td-post-content"]:
+        content_div = soup.select_one(selector)
+        if content_div:
+            break
+    if not content_div:
+        content_div = soup.body
+    full_text = " ".join(clean_text(text) for text in content_div.stripped_strings) if content_div else ""
+    return {"full_text": full_text, "title": title}
+
+
+def streaming_extract(body):
+    chunks = (body[i:i + STREAM_CHUNK_BYTES] for i in range(0, len(body), STREAM_CHUNK_BYTES))
+    return _extract_chunks(chunks, "utf-8")[0]
+
+
+def measure(extract, body, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.process_time()
+        page = extract(body)
+        times.append(time.process_time() - start)
+
+    tracemalloc.start()
+    extract(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times) * 1000, peak / (1024 * 1024), len(page["full_text"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", help="Directory of saved .html pages (default: synthetic pages)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    if not pages:
+        raise SystemExit(f"No .html files in {args.pages}")
+
+    print(f"{'page':<24}{'KiB':>8}{'old ms':>10}{'new ms':>10}{'old MiB':>10}{'new MiB':>10}"
+          f"{'old chars':>11}{'new chars':>11}")
+    for name, body in pages:
+        old_ms, old_peak, old_chars = measure(legacy_extract, body, args.repeat)
+        new_ms, new_peak, new_chars = measure(streaming_extract, body, args.repeat)
+        print(f"{name[:23]:<24}{len(body) / 1024:>8.0f}{old_ms:>10.1f}{new_ms:>10.1f}{old_peak:>10.2f}"
+              f"{new_peak:>10.2f}{old_chars:>11}{new_chars:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Microbenchmark: per-stage cost of turning an upload into a model input.
+
+Compares the old Predictor.predict preprocessing (Compose rebuilt per call,
+full-resolution decode, torch.ones + torch.cat for the 4th channel) with
+ImagePreprocessor (draft() reduced-size JPEG decode, direct buffer write),
+per stage, on synthetic phone-sized JPEGs. Also times a parallel batch decode.
+Run from the project root (next to run.py):
+
+    python benchmarks/bench_preprocess.py --width 4032 --height 3024 --images 16
+"""
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_model.coin_classifier import Config  # noqa: E402
+from ai_model.preprocessing import ImagePreprocessor  # noqa: E402
+
+
+def make_jpeg(width, height, seed):
+    rng = np.random.default_rng(seed)
+    # Smooth gradients + noise compress like a photo rather than like pure noise
+    base = np.linspace(0, 255, width, dtype=np.float32)[None, :, None].repeat(height, 0).repeat(3, 2)
+    arr = np.clip(base + rng.normal(0, 20, size=base.shape), 0, 255).astype(np.uint8)
+    buf = BytesIO()
+    Image.fromarray(arr).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def timed(stages, name, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+    return result
+
+
+def legacy(image_bytes, cfg, stages):
+    transform = timed(stages, "build transform", lambda: transforms.Compose([
+        transforms.Resize((cfg.image_size, cfg.image_size)),
+        transforms.ToTensor(),
+    ]))
+    img = timed(stages, "decode", lambda: Image.open(BytesIO(image_bytes)).convert("RGB"))
+    resized = timed(stages, "resize", transforms.Resize((cfg.image_size, cfg.image_size)), img)
+    x = timed(stages, "to tensor", transforms.ToTensor(), resized)
+    timed(stages, "4th channel", lambda: torch.cat([x, torch.ones(1, cfg.image_size, cfg.image_size)], dim=0))
+    return transform
+
+
+def fast(image_bytes, pre, stages):
+    out = timed(stages, "4th channel", pre.new_buffer)
+    img = timed(stages, "decode", pre.open, image_bytes)
+    resized = timed(stages, "resize", pre.resize, img)
+    return timed(stages, "to tensor", pre.write, resized, out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--images", type=int, default=16)
+    args = parser.parse_args()
+
+    cfg = Config()
+    pre = ImagePreprocessor(cfg)
+    images = [make_jpeg(args.width, args.height, seed) for seed in range(args.images)]
+
+    results = {}
+    for name, fn, arg in (("legacy", legacy, cfg), ("fast", fast, pre)):
+        stages = {}
+        for image_bytes in images:
+            fn(image_bytes, arg, stages)
+        results[name] = stages
+
+    names = ["build transform", "decode", "resize", "to tensor", "4th channel"]
+    print(f"{'stage (ms/image)':<20}{'legacy':>10}{'fast':>10}")
+    for stage in names:
+        row = [results[v].get(stage, 0.0) * 1000 / len(images) for v in ("legacy", "fast")]
+        print(f"{stage:<20}{row[0]:>10.2f}{row[1]:>10.2f}")
+    totals = [sum(results[v].values()) * 1000 / len(images) for v in ("legacy", "fast")]
+    print(f"{'total':<20}{totals[0]:>10.2f}{totals[1]:>10.2f}")
+
+    start = time.perf_counter()
+    pre.preprocess_batch(images)
+    elapsed = time.perf_counter() - start
+    print(f"\nparallel preprocess_batch: {elapsed * 1000 / len(images):.2f} ms/image "
+          f"({len(images) / elapsed:.1f} images/s)")
+
+
+if __name__ == "__main__":
+    main()
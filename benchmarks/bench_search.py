@@ -0,0 +1,94 @@
+"""
+Benchmark: the old per-key N+1 catalogue search vs. search.search_catalogue.
+
+Seeds a SQLite stand-in for the MySQL catalogue with thousands of dynasty keys
+(and several coins per key) in every period, then times both strategies and
+counts the SQL statements each one issues. Run from the project root:
+
+    python benchmarks/bench_search.py --keys 5000 --coins-per-key 4
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from flask import Flask
+from sqlalchemy import event, or_
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import db  # noqa: E402
+from src import search  # noqa: E402
+
+DYNASTIES = ["Kushan", "Gupta", "Maurya", "Satavahana", "Chola", "Pandya", "Mughal", "Maratha", "Kshatrapa"]
+KINGS = ["Kanishka", "Huvishka", "Vasudeva", "Chandragupta", "Samudragupta", "Ashoka", "Akbar", "Shivaji"]
+
+
+def seed(keys, coins_per_key):
+    rng = random.Random(0)
+    for period, models in search.MODEL_MAP.items():
+        KeyModel, DataModel = models['keys'], models['data']
+        key_rows, coin_rows = [], []
+        for i in range(keys):
+            code = f"{period[:2].upper()}{i:05d}"
+            key_rows.append({'id': i + 1, 'dynasty': f"{rng.choice(DYNASTIES)} {i % 97}",
+                             'king_name': f"{rng.choice(KINGS)} {i % 89}", 'code': code})
+            for j in range(coins_per_key):
+                coin_rows.append({'s_no': len(coin_rows) + 1, 'code': f"{code}{j:02d}",
+                                  'details': f"Copper coin {j} of {code}"})
+        db.session.bulk_insert_mappings(KeyModel, key_rows)
+        db.session.bulk_insert_mappings(DataModel, coin_rows)
+    db.session.commit()
+
+
+def legacy_search(query):
+    """The pre-rewrite api_search loop: one coin query per matched key."""
+    results = []
+    terms = query.split()
+    for models in search.MODEL_MAP.values():
+        KeyModel, DataModel = models['keys'], models['data']
+        filters = [or_(KeyModel.dynasty.like(f'%{t}%'), KeyModel.king_name.like(f'%{t}%')) for t in terms]
+        for key in KeyModel.query.filter(or_(*filters)).all():
+            for coin in DataModel.query.filter(DataModel.code.startswith(key.code)).all():
+                results.append(coin.to_dict_with_key_info(key))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=5000)
+    parser.add_argument("--coins-per-key", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db_file = os.path.join(tempfile.mkdtemp(), "catalogue.sqlite3")
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_file}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        seed(args.keys, args.coins_per_key)
+        search.refresh_table_cache()
+
+        statements = [0]
+        event.listen(db.engine, "before_cursor_execute", lambda *a: statements.__setitem__(0, statements[0] + 1))
+
+        print(f"{'query':<16}{'strategy':<10}{'results':>9}{'queries':>9}{'ms':>10}")
+        for query in ("Kanishka", "Gupta Akbar", "Kushan 1"):
+            for name, fn in (("legacy", legacy_search),
+                             ("batched", lambda q: search.search_catalogue(q, with_images=False))):
+                statements[0] = 0
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    results = fn(query)
+                elapsed = (time.perf_counter() - start) / args.repeat
+                print(f"{query:<16}{name:<10}{len(results):>9}{statements[0] // args.repeat:>9}"
+                      f"{elapsed * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Load test: requests/sec of the production server (serve.py) as workers are added.
+
+For each worker count, starts `serve.py --workers N` on a local port, waits
+until every worker answers, then has `--concurrency` client threads post
+single-image identifications for `--duration` seconds. The batch endpoint is
+used because it runs only inference (no web search, no prediction cache), so
+the numbers are about model throughput. Reports requests/sec and p50/p95
+latency per worker count. The started servers exempt 127.0.0.1 from the
+per-client rate limit (COIN_RATE_LIMIT_EXEMPT); any 429 aborts the run, since
+it would measure the limiter rather than the workers. Run from the project
+root (next to run.py):
+
+    python benchmarks/bench_serve.py --workers 1 2 4 --concurrency 16 --duration 20
+
+With --url, the given already-running server is measured instead (worker
+counts are then ignored); start it with COIN_RATE_LIMIT_EXEMPT set to this
+machine's address.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from io import BytesIO
+
+import numpy as np
+import requests
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINT = "/api/ai-identify/batch"
+LOCAL_CLIENTS = "127.0.0.1,::1"
+
+
+class RateLimited(RuntimeError):
+    pass
+
+
+def make_jpegs(count, size=(1024, 768), seed=0):
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        arr = rng.integers(0, 255, size=(size[1], size[0], 3), dtype=np.uint8)
+        buf = BytesIO()
+        Image.fromarray(arr).save(buf, format="JPEG", quality=85)
+        images.append(buf.getvalue())
+    return images
+
+
+def identify(session, url, image_bytes):
+    resp = session.post(url + ENDPOINT, files={"coin_images": ("coin.jpg", image_bytes, "image/jpeg")}, timeout=60)
+    if resp.status_code == 429:
+        raise RateLimited(f"{url} rate-limited the benchmark client (429); set COIN_RATE_LIMIT_EXEMPT "
+                          f"on the server to this client's address")
+    resp.raise_for_status()
+    return resp
+
+
+def wait_until_ready(url, image_bytes, timeout=300):
+    deadline = time.monotonic() + timeout
+    with requests.Session() as session:
+        while time.monotonic() < deadline:
+            try:
+                identify(session, url, image_bytes)
+                return
+            except requests.RequestException:
+                time.sleep(1)
+    raise RuntimeError(f"Server at {url} did not become ready within {timeout}s")
+
+
+def load(url, images, concurrency, duration):
+    latencies, errors, limited = [], [0], []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(offset):
+        with requests.Session() as session:
+            i = offset
+            while time.monotonic() < stop_at and not limited:
+                t0 = time.perf_counter()
+                try:
+                    identify(session, url, images[i % len(images)])
+                    elapsed = time.perf_counter() - t0
+                    with lock:
+                        latencies.append(elapsed)
+                except RateLimited as e:
+                    with lock:
+                        limited.append(e)
+                except requests.RequestException:
+                    with lock:
+                        errors[0] += 1
+                i += concurrency
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    if limited:
+        raise SystemExit(f"Aborted: {limited[0]}")
+
+    lat = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return len(latencies) / wall, np.percentile(lat, 50), np.percentile(lat, 95), errors[0]
+
+
+def start_server(workers, port):
+    # New session so the whole gunicorn process group can be stopped together
+    env = dict(os.environ, COIN_RATE_LIMIT_EXEMPT=LOCAL_CLIENTS)
+    return subprocess.Popen([sys.executable, "serve.py", "--workers", str(workers), "--bind", f"127.0.0.1:{port}"],
+                            cwd=ROOT, env=env, start_new_session=True)
+
+
+def stop_server(proc):
+    os.killpg(proc.pid, signal.SIGTERM)
+    try:
+        proc.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--url", help="Measure an already-running server instead of starting serve.py")
+    args = parser.parse_args()
+
+    images = make_jpegs(64)
+    print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+
+    if args.url:
+        url = args.url.rstrip("/")
+        wait_until_ready(url, images[0])
+        rate, p50, p95, errors = load(url, images, args.concurrency, args.duration)
+        print(f"{'-':>8}{rate:>10.1f}{p50:>10.1f}{p95:>10.1f}{errors:>8}")
+        return
+
+    url = f"http://127.0.0.1:{args.port}"
+    for workers in args.workers:
+        proc = start_server(workers, args.port)
+        try:
+            wait_until_ready(url, images[0])
+            # Make sure every worker, not just the first, has warmed up before measuring
+            load(url, images, args.concurrency, 2)
+            rate, p50, p95, errors = load(url, images, args.concurrency, args.duration)
+            print(f"{workers:>8}{rate:>10.1f}{p50:>10.1f}{p95:>10.1f}{errors:>8}")
+        finally:
+            stop_server(proc)
+
+
+if __name__ == "__main__":
+    main()
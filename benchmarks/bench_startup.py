@@ -0,0 +1,63 @@
+"""
+Benchmark: model start-up time and memory, old path vs. new path.
+
+Each variant runs in a fresh interpreter so nothing is shared between runs:
+  legacy  - ImageNet-pretrained DenseNet121 + full torch.load + load_state_dict
+  mmap    - Predictor(): no pretrained weights, meta-device build, mmap'd checkpoint
+Reports wall time to a loaded model and the process's resident memory.
+Run from the project root (next to run.py):
+
+    python benchmarks/bench_startup.py --repeat 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LEGACY = """
+import os, time, json, resource
+t0 = time.perf_counter()
+import torch
+from ai_model.coin_classifier import Config, ProtoPNet
+cfg = Config(); cfg.device = "cpu"
+train = cfg.train_dir
+classes = [d for d in os.listdir(train) if os.path.isdir(os.path.join(train, d))] if os.path.isdir(train) else []
+model = ProtoPNet(cfg, len(classes) or 39)
+model.load_state_dict(torch.load(cfg.save_path, map_location="cpu"))
+model.eval()
+print(json.dumps({"seconds": time.perf_counter() - t0,
+                  "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+MMAP = """
+import time, json, resource
+t0 = time.perf_counter()
+from ai_model.predictor import Predictor
+Predictor(backend="eager")
+print(json.dumps({"seconds": time.perf_counter() - t0,
+                  "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def run(code):
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'variant':<10}{'run':>5}{'seconds':>10}{'max RSS MB':>12}")
+    for name, code in (("legacy", LEGACY), ("mmap", MMAP)):
+        for i in range(args.repeat):
+            result = run(code)
+            print(f"{name:<10}{i:>5}{result['seconds']:>10.2f}{result['max_rss_mb']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Where the on-disk tier lives: <project root>/instance/, next to Flask's instance folder
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'instance'))
+CACHE_DB_PATH = os.path.join(CACHE_DIR, 'scraper_cache.sqlite3')
+
+
+class TTLCache:
+    """
+    Two-tier cache: an in-process LRU in front of a shared SQLite table.
+
+    Every entry carries its own expiry time. The memory tier is bounded by
+    entry count; the disk tier by total bytes, evicting least recently used
+    rows first. Values must be JSON-serialisable. Several caches can share one
+    database file, each under its own `namespace`.
+    """
+
+    def __init__(self, namespace, ttl, max_memory_entries=512, max_disk_bytes=64 * 1024 * 1024,
+                 db_path=CACHE_DB_PATH):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._writes_since_evict = 0
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+        self.db_path = db_path
+        self._connection = None
+        self._connection_pid = None
+
+    @property
+    def _db(self):
+        # One handle per process: a SQLite connection inherited across fork() (pre-fork servers) is unsafe
+        if self.db_path is None:
+            return None
+        if self._connection is None or self._connection_pid != os.getpid():
+            try:
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS cache_entries ("
+                    " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                    " size INTEGER NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+                    " PRIMARY KEY (namespace, key))"
+                )
+                db.execute(
+                    "CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed ON cache_entries (namespace, accessed_at)"
+                )
+            except (OSError, sqlite3.Error) as e:
+                print(f"[Cache] Disk cache disabled for '{self.namespace}': {e}")
+                self.db_path = None
+                return None
+            self._connection = db
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits_memory += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key)
+                ).fetchone()
+                if row is not None:
+                    if row[1] > now:
+                        value = json.loads(row[0])
+                        self._db.execute(
+                            "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                            (now, self.namespace, key)
+                        )
+                        self._remember(key, row[1], value)
+                        self.hits_disk += 1
+                        return value
+                    self._db.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                                     (self.namespace, key))
+
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is None:
+                return
+
+            payload = json.dumps(value)
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, size, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, payload, len(payload), expires_at, now)
+            )
+            # Checking the disk budget on every write would cost a SUM() scan each time
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= 32:
+                self._writes_since_evict = 0
+                self._evict_disk(now)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                'namespace': self.namespace,
+                'memory_entries': len(self._memory),
+                'hits_memory': self.hits_memory,
+                'hits_disk': self.hits_disk,
+                'misses': self.misses,
+                'hit_rate': (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            }
+
+    def _remember(self, key, expires_at, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        self._db.execute("DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?",
+                         (self.namespace, now))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+                                 (self.namespace,)).fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+
+        excess = total - self.max_disk_bytes
+        freed = 0
+        stale_keys = []
+        for key, size in self._db.execute(
+                "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY accessed_at",
+                (self.namespace,)):
+            stale_keys.append((self.namespace, key))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", stale_keys)
@@ -10,9 +10,6 @@ import torch.optim as optim
 import torchvision.models as models
 import numpy as np
 import pandas as pd
-from sklearn.metrics import classification_report, accuracy_score, confusion_matrix, roc_curve, auc
-from sklearn.preprocessing import label_binarize
-import matplotlib.pyplot as plt
 import cv2
 
 class Config:
@@ -46,6 +43,45 @@ class Config:
         # 🔹 NEW: preload switch
         self.preload_data = False
 
+        # Packed copies of train/val/test (feature_shards.py); used when <shard_dir>/<split>/index.json exists
+        self.shard_dir = os.path.join(self.base_dir, "shards")
+
+        # Training loop (train.py)
+        self.num_workers = min(8, os.cpu_count() or 1)
+        self.prefetch_factor = 4
+        self.grad_accum_steps = 1
+        self.amp = True                 # bf16 autocast on CPU, fp16 on CUDA
+        self.compile_model = False      # torch.compile; worth it for long runs, slow to warm up
+        self.clst_coef = 0.8            # ProtoPNet cluster / separation cost weights
+        self.sep_coef = 0.08
+        self.log_interval = 20
+        self.train_state_path = os.path.join(self.save_dir, "train_state.pth")
+
+        # Inference micro-batching (web server)
+        self.max_batch_size = 16
+        self.max_batch_wait_ms = 10
+
+        # Inference backend: "eager", "torchscript" or "onnx" (artifacts from export_model.py)
+        self.inference_backend = "eager"
+        self.torchscript_path = os.path.join(self.save_dir, "model.ts")
+        self.onnx_path = os.path.join(self.save_dir, "model.onnx")
+
+        # Prediction cache for repeated uploads (0 disables; set a path to persist across restarts)
+        self.prediction_cache_size = 1024
+        self.prediction_cache_path = None
+
+        # Explanations: nearest prototypes reported per explained class
+        self.explain_prototypes = 3
+        # Where push.py records the training patch each prototype was projected onto
+        self.prototype_provenance_path = os.path.join(self.save_dir, "prototypes.json")
+
+        # Offline backbone features (extract_features.py): <image_dir>/<split>/<class>/<image> in,
+        # <feature_dir>/<split>/<class>/<content hash>.pt out, for `train.py --cached-features`
+        self.image_dir = os.path.join(self.base_dir, "images")
+        self.feature_dir = os.path.join(self.base_dir, "features")
+        # Starting weights used when features are extracted before any model.pth exists; never served
+        self.backbone_init_path = os.path.join(self.save_dir, "backbone_init.pth")
+
 
 # ============================================================
 # DATASET
@@ -98,11 +134,17 @@ class ProtoFeatureDataset(Dataset):
 # ============================================================
 # BACKBONE
 # ============================================================
+# Spatial size of the projected feature map; each cell is one prototype-matchable patch
+FEATURE_GRID = (4, 4)
+
+
 class DenseNetBackbone(nn.Module):
-    def __init__(self, in_channels=4, out_dim=128):
+    def __init__(self, in_channels=4, out_dim=128, pretrained=True):
         super().__init__()
 
-        net = models.densenet121(weights=models.DenseNet121_Weights.IMAGENET1K_V1)
+        # Skip the ImageNet download when a trained checkpoint will overwrite the weights anyway
+        weights = models.DenseNet121_Weights.IMAGENET1K_V1 if pretrained else None
+        net = models.densenet121(weights=weights)
 
         old_conv = net.features.conv0
         new_conv = nn.Conv2d(
@@ -122,7 +164,7 @@ class DenseNetBackbone(nn.Module):
         net.features.conv0 = new_conv
 
         self.encoder = net.features
-        self.pool = nn.AdaptiveAvgPool2d((4, 4))
+        self.pool = nn.AdaptiveAvgPool2d(FEATURE_GRID)
         self.project = nn.Conv2d(1024, out_dim, 1)
 
     def forward(self, x):
@@ -135,13 +177,13 @@ class DenseNetBackbone(nn.Module):
 # PROTOPNET
 # ============================================================
 class ProtoPNet(nn.Module):
-    def __init__(self, cfg, num_classes):
+    def __init__(self, cfg, num_classes, pretrained_backbone=True):
         super().__init__()
 
         self.k = cfg.num_prototypes_per_class
         self.P = num_classes * self.k
 
-        self.features = DenseNetBackbone(cfg.input_channels)
+        self.features = DenseNetBackbone(cfg.input_channels, pretrained=pretrained_backbone)
         self.add_on = nn.ReLU()
 
         self.prototype_vectors = nn.Parameter(torch.randn(self.P, 128))
@@ -154,17 +196,29 @@ class ProtoPNet(nn.Module):
         for j in range(self.P):
             self.last_layer.weight.data[j // self.k, j] = 1.0
 
-    def forward(self, x):
-        x = self.add_on(self.features(x))
+    def patches(self, x, from_features=False):
+        """
+        Projected feature map as [B, H*W, C]: one row per prototype-matchable patch.
+        With `from_features`, `x` is already the backbone output (e.g. cached by extract_features.py).
+        """
+        x = self.add_on(x if from_features else self.features(x))
         B, C, H, W = x.shape
-        x = x.view(B, C, -1).permute(0, 2, 1)
+        return x.reshape(B, C, -1).permute(0, 2, 1)
 
-        x2 = (x ** 2).sum(dim=2, keepdim=True)
+    def patch_distances(self, x):
+        """Squared L2 distance from every patch row of `x` [..., C] to every prototype, as [..., P]."""
+        # |x|^2 - 2 x.p + |p|^2: one matmul instead of materializing every patch-prototype difference
+        x2 = (x ** 2).sum(dim=-1, keepdim=True)
         p2 = (self.prototype_vectors ** 2).sum(dim=1)
         xp = torch.matmul(x, self.prototype_vectors.t())
+        return x2 - 2 * xp + p2
 
-        distances = x2 - 2 * xp + p2.view(1, 1, -1)
-        distances = distances.min(dim=1)[0]
+    def forward(self, x, return_locations=False, from_features=False):
+        distances = self.patch_distances(self.patches(x, from_features))
+        # min() yields the argmin for free: the flattened H*W patch each prototype matched best
+        distances, locations = distances.min(dim=1)
 
         logits = self.last_layer(-distances)
+        if return_locations:
+            return logits, distances, locations
         return logits, distances
\ No newline at end of file
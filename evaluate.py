@@ -0,0 +1,266 @@
+"""
+Evaluate a checkpoint on val/test and write a machine-readable report.
+
+    python -m ai_model.evaluate [--split test] [--checkpoint model.pth] [--workers 8] [--plots]
+    python -m ai_model.evaluate --baseline eval_test.json    # exit 1 on an accuracy or speed regression
+
+Inference runs batched under inference_mode with DataLoader workers decoding
+ahead; logits are written into preallocated arrays. Everything derived from
+them (accuracy, top-5, per-class precision/recall/F1, the confusion matrix,
+one-vs-rest ROC curves and AUC) is computed with vectorized NumPy, so the
+report doesn't need scikit-learn. The report also records throughput and
+per-batch forward latency, so comparing it against a previous run
+(--baseline) doubles as a performance regression check.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+from .coin_classifier import Config, ProtoPNet
+from .predictor import load_checkpoint
+from .train import autocast, make_loader, open_split, split_dirs
+
+
+# ============================================================
+# INFERENCE
+# ============================================================
+def collect_logits(model, loader, num_samples, num_classes, device, cfg, cached_features=False):
+    """Returns (logits [N, C], labels [N], per-batch forward seconds, wall seconds)."""
+    logits = np.empty((num_samples, num_classes), dtype=np.float32)
+    labels = np.empty(num_samples, dtype=np.int64)
+    forward_times = []
+
+    model.eval()
+    offset = 0
+    start = time.perf_counter()
+    with torch.inference_mode(), autocast(cfg, device):
+        for x, y in loader:
+            x = x.to(device, non_blocking=True)
+            t0 = time.perf_counter()
+            out, _ = model(x, from_features=cached_features)
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            forward_times.append(time.perf_counter() - t0)
+
+            n = y.shape[0]
+            logits[offset:offset + n] = out.float().cpu().numpy()
+            labels[offset:offset + n] = y.numpy()
+            offset += n
+    return logits[:offset], labels[:offset], np.array(forward_times), time.perf_counter() - start
+
+
+# ============================================================
+# METRICS
+# ============================================================
+def softmax(logits):
+    z = logits - logits.max(axis=1, keepdims=True)
+    np.exp(z, out=z)
+    return z / z.sum(axis=1, keepdims=True)
+
+
+def confusion_matrix(labels, predictions, num_classes):
+    return np.bincount(labels * num_classes + predictions, minlength=num_classes ** 2).reshape(num_classes, num_classes)
+
+
+def per_class_report(cm):
+    tp = np.diag(cm).astype(np.float64)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.nan_to_num(tp / predicted)
+        recall = np.nan_to_num(tp / support)
+        f1 = np.nan_to_num(2 * precision * recall / (precision + recall))
+    return precision, recall, f1, support
+
+
+def roc_curve(scores, positives):
+    """One-vs-rest ROC for one class: (fpr, tpr, auc), with one point per distinct score."""
+    order = np.argsort(-scores, kind="mergesort")
+    scores, positives = scores[order], positives[order]
+    # Last index of each run of equal scores: ties move the curve diagonally, not in steps
+    distinct = np.r_[np.flatnonzero(np.diff(scores)), scores.size - 1]
+    tps = np.cumsum(positives)[distinct]
+    fps = distinct + 1 - tps
+    tpr = np.r_[0.0, tps / tps[-1]] if tps[-1] else np.zeros(distinct.size + 1)
+    fpr = np.r_[0.0, fps / fps[-1]] if fps[-1] else np.zeros(distinct.size + 1)
+    auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    return fpr, tpr, auc
+
+
+def compute_metrics(logits, labels, classes):
+    num_classes = len(classes)
+    probabilities = softmax(logits.copy())
+    predictions = logits.argmax(axis=1)
+    cm = confusion_matrix(labels, predictions, num_classes)
+    precision, recall, f1, support = per_class_report(cm)
+
+    top5 = np.argpartition(-logits, min(5, num_classes) - 1, axis=1)[:, :5]
+    one_hot = np.zeros_like(probabilities, dtype=bool)
+    one_hot[np.arange(labels.size), labels] = True
+
+    curves, aucs = {}, np.full(num_classes, np.nan)
+    for c in range(num_classes):
+        # AUC is undefined for a class with no positives (or no negatives) in this split
+        if 0 < support[c] < labels.size:
+            fpr, tpr, aucs[c] = roc_curve(probabilities[:, c], one_hot[:, c])
+            curves[classes[c]] = (fpr, tpr)
+    _, _, micro_auc = roc_curve(probabilities.ravel(), one_hot.ravel())
+
+    weights = support / max(support.sum(), 1)
+    metrics = {
+        "samples": int(labels.size),
+        "accuracy": float((predictions == labels).mean()) if labels.size else 0.0,
+        "top5_accuracy": float((top5 == labels[:, None]).any(axis=1).mean()) if labels.size else 0.0,
+        "macro_avg": {"precision": float(precision.mean()), "recall": float(recall.mean()),
+                      "f1": float(f1.mean())},
+        "weighted_avg": {"precision": float(precision @ weights), "recall": float(recall @ weights),
+                         "f1": float(f1 @ weights)},
+        "roc_auc": {"macro": float(np.nanmean(aucs)) if not np.isnan(aucs).all() else None,
+                    "micro": micro_auc},
+        "per_class": {
+            cls: {"precision": float(precision[i]), "recall": float(recall[i]), "f1": float(f1[i]),
+                  "support": int(support[i]), "auc": None if np.isnan(aucs[i]) else float(aucs[i])}
+            for i, cls in enumerate(classes)
+        },
+        "confusion_matrix": cm.tolist(),
+    }
+    return metrics, curves
+
+
+def performance(forward_times, wall_seconds, samples, batch_size):
+    total_forward = float(forward_times.sum()) if forward_times.size else 0.0
+    return {
+        "batch_size": batch_size,
+        "wall_seconds": round(wall_seconds, 3),
+        "samples_per_second": round(samples / wall_seconds, 2) if wall_seconds else 0.0,
+        "forward_samples_per_second": round(samples / total_forward, 2) if total_forward else 0.0,
+        "batch_latency_ms": {
+            "p50": round(float(np.percentile(forward_times, 50)) * 1000, 2) if forward_times.size else None,
+            "p95": round(float(np.percentile(forward_times, 95)) * 1000, 2) if forward_times.size else None,
+            "max": round(float(forward_times.max()) * 1000, 2) if forward_times.size else None,
+        },
+        "threads": torch.get_num_threads(),
+    }
+
+
+# ============================================================
+# OUTPUT
+# ============================================================
+def save_plots(metrics, curves, classes, out_prefix):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    cm = np.array(metrics["confusion_matrix"])
+    fig, ax = plt.subplots(figsize=(12, 10))
+    ax.imshow(cm, cmap="Blues")
+    ax.set_xticks(range(len(classes)), classes, rotation=90, fontsize=6)
+    ax.set_yticks(range(len(classes)), classes, fontsize=6)
+    ax.set_xlabel("Predicted")
+    ax.set_ylabel("True")
+    fig.tight_layout()
+    fig.savefig(f"{out_prefix}_confusion.png", dpi=150)
+    plt.close(fig)
+
+    fig, ax = plt.subplots(figsize=(8, 8))
+    for cls, (fpr, tpr) in curves.items():
+        ax.plot(fpr, tpr, linewidth=0.8, label=f"{cls} ({metrics['per_class'][cls]['auc']:.3f})")
+    ax.plot([0, 1], [0, 1], "k--", linewidth=0.5)
+    ax.set_xlabel("False positive rate")
+    ax.set_ylabel("True positive rate")
+    ax.legend(fontsize=5, ncol=2)
+    fig.tight_layout()
+    fig.savefig(f"{out_prefix}_roc.png", dpi=150)
+    plt.close(fig)
+
+
+def compare_to_baseline(report, baseline_path, max_accuracy_drop, max_slowdown):
+    """Prints deltas against an earlier report; returns False on a regression."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    ok = True
+    accuracy_delta = report["accuracy"] - baseline["accuracy"]
+    print(f"[Eval] accuracy {baseline['accuracy']:.4f} -> {report['accuracy']:.4f} ({accuracy_delta:+.4f})")
+    if accuracy_delta < -max_accuracy_drop:
+        print(f"[Eval] REGRESSION: accuracy dropped by more than {max_accuracy_drop}")
+        ok = False
+
+    before = baseline["performance"]["forward_samples_per_second"]
+    after = report["performance"]["forward_samples_per_second"]
+    if before:
+        change = after / before - 1
+        print(f"[Eval] forward throughput {before:.1f} -> {after:.1f} samples/s ({change:+.1%})")
+        if change < -max_slowdown:
+            print(f"[Eval] REGRESSION: throughput dropped by more than {max_slowdown:.0%}")
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--split", choices=["val", "test"], default="test")
+    parser.add_argument("--checkpoint", help="Defaults to Config.save_path")
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--workers", type=int, help="DataLoader worker processes")
+    parser.add_argument("--amp", action="store_true", help="Evaluate under bf16/fp16 autocast")
+    parser.add_argument("--cached-features", action="store_true", help="Evaluate on extract_features.py output")
+    parser.add_argument("--out", help="Report path (defaults to <save_dir>/eval_<split>.json)")
+    parser.add_argument("--plots", action="store_true", help="Also save confusion-matrix and ROC plots")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.005)
+    parser.add_argument("--max-slowdown", type=float, default=0.2)
+    args = parser.parse_args()
+
+    cfg = Config()
+    if args.batch_size is not None:
+        cfg.batch_size = args.batch_size
+    if args.workers is not None:
+        cfg.num_workers = args.workers
+    cfg.amp = args.amp
+    device = torch.device(cfg.device)
+    checkpoint = args.checkpoint or cfg.save_path
+
+    # Class indices come from the training split, exactly as Predictor maps them
+    train_dir = split_dirs(cfg, "train", args.cached_features)[0]
+    classes = sorted(d for d in os.listdir(train_dir) if os.path.isdir(os.path.join(train_dir, d)))
+    dataset = open_split(cfg, args.split, args.cached_features)
+    if len(dataset) == 0:
+        raise RuntimeError(f"No {args.split} samples found")
+    if list(dataset.classes) != classes:
+        raise RuntimeError(f"{args.split} classes don't match the training classes; indices would be misaligned")
+
+    model = ProtoPNet(cfg, len(classes), pretrained_backbone=False)
+    model.load_state_dict(load_checkpoint(checkpoint))
+    model.to(device)
+
+    loader = make_loader(dataset, cfg, shuffle=False)
+    logits, labels, forward_times, wall = collect_logits(model, loader, len(dataset), len(classes), device, cfg,
+                                                         cached_features=args.cached_features)
+    metrics, curves = compute_metrics(logits, labels, classes)
+    report = {"checkpoint": checkpoint, "split": args.split, "classes": classes, **metrics,
+              "performance": performance(forward_times, wall, labels.size, cfg.batch_size)}
+
+    out = args.out or os.path.join(cfg.save_dir, f"eval_{args.split}.json")
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    perf = report["performance"]
+    print(f"[Eval] {args.split}: accuracy {report['accuracy']:.4f}, top-5 {report['top5_accuracy']:.4f}, "
+          f"macro F1 {report['macro_avg']['f1']:.4f}, macro AUC {report['roc_auc']['macro']}")
+    print(f"[Eval] {perf['samples_per_second']:.1f} samples/s end to end, "
+          f"{perf['forward_samples_per_second']:.1f} samples/s forward, "
+          f"batch p50 {perf['batch_latency_ms']['p50']} ms / p95 {perf['batch_latency_ms']['p95']} ms")
+    print(f"[Eval] Report written to {out}")
+
+    if args.plots:
+        save_plots(report, curves, classes, os.path.splitext(out)[0])
+    if args.baseline and not compare_to_baseline(report, args.baseline, args.max_accuracy_drop, args.max_slowdown):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Export ProtoPNet to optimized inference artifacts and check them against the
+eager model.
+
+    python -m ai_model.export_model --formats torchscript onnx
+    python -m ai_model.export_model --quantize static --calibration-dir <images> --parity-dir <images> --benchmark
+
+TorchScript artifacts are traced from the full model (DenseNet backbone plus
+the prototype distance head) and frozen. Quantized variants are saved as
+TorchScript too, so Predictor loads every variant the same way: set
+Config.inference_backend to "torchscript" (or "onnx") and point
+Config.torchscript_path / Config.onnx_path at the artifact.
+
+Only static (FX) quantization is offered: the model's compute is all in the
+DenseNet convolutions, and dynamic quantization only covers Linear layers
+(here just the tiny last layer), so it would produce no speed-up.
+"""
+import argparse
+import copy
+import os
+import time
+
+import numpy as np
+import torch
+
+from .predictor import OnnxModel, Predictor
+from .preprocessing import IMAGE_EXTENSIONS
+
+
+# ============================================================
+# EXPORT
+# ============================================================
+def example_input(cfg, batch_size=1):
+    return torch.rand(batch_size, cfg.input_channels, cfg.image_size, cfg.image_size)
+
+
+def export_torchscript(model, cfg, path, optimize=True):
+    """Traces the model, freezes its weights into the graph and saves it."""
+    with torch.no_grad():
+        traced = torch.jit.trace(model.eval(), example_input(cfg, 2))
+        traced = torch.jit.freeze(traced)
+        if optimize:
+            traced = torch.jit.optimize_for_inference(traced)
+    traced.save(path)
+    print(f"[Export] TorchScript model written to {path}")
+    return traced
+
+
+def export_onnx(model, cfg, path, opset=17):
+    """Writes an ONNX graph with a dynamic batch dimension."""
+    torch.onnx.export(
+        model.eval(),
+        example_input(cfg, 2),
+        path,
+        input_names=["image"],
+        output_names=["logits", "distances"],
+        dynamic_axes={"image": {0: "batch"}, "logits": {0: "batch"}, "distances": {0: "batch"}},
+        opset_version=opset,
+    )
+    print(f"[Export] ONNX model written to {path}")
+
+
+# ============================================================
+# QUANTIZATION
+# ============================================================
+def quantize_static(model, cfg, calibration_batches):
+    """
+    Post-training static int8 quantization of the DenseNet backbone (where
+    almost all the FLOPs are) using FX graph mode. The prototype distance head
+    stays in float32 so distances keep their precision.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    quantized = copy.deepcopy(model).eval()
+    qconfig_mapping = get_default_qconfig_mapping("x86")
+    prepared = prepare_fx(quantized.features, qconfig_mapping, example_inputs=(example_input(cfg),))
+
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch)
+
+    quantized.features = convert_fx(prepared)
+    return quantized
+
+
+# ============================================================
+# PARITY + BENCHMARK
+# ============================================================
+def load_image_folder(root, predictor, limit=None):
+    """Reads <root>/<class>/<image> into (stacked inputs, label indices) using the predictor's preprocessing."""
+    class_to_idx = {c: i for i, c in enumerate(predictor.classes)}
+    inputs, labels = [], []
+    for cls in sorted(os.listdir(root)):
+        cls_dir = os.path.join(root, cls)
+        if not os.path.isdir(cls_dir) or cls not in class_to_idx:
+            continue
+        for f in sorted(os.listdir(cls_dir)):
+            if not f.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            with open(os.path.join(cls_dir, f), "rb") as fh:
+                inputs.append(predictor.preprocess(fh.read()))
+            labels.append(class_to_idx[cls])
+            if limit and len(inputs) >= limit:
+                return torch.stack(inputs), torch.tensor(labels)
+    if not inputs:
+        raise RuntimeError(f"No labelled images found under {root}")
+    return torch.stack(inputs), torch.tensor(labels)
+
+
+def batches(inputs, batch_size):
+    for i in range(0, len(inputs), batch_size):
+        yield inputs[i:i + batch_size]
+
+
+def run_model(model, inputs, batch_size):
+    with torch.no_grad():
+        return torch.cat([model(batch)[0] for batch in batches(inputs, batch_size)])
+
+
+def parity_report(variants, inputs, labels, batch_size=32):
+    """Accuracy of every variant and how closely it tracks the eager model's logits and top-1."""
+    reference = run_model(variants["eager"], inputs, batch_size)
+    reference_top1 = reference.argmax(dim=1)
+
+    print(f"{'variant':<14}{'accuracy':>10}{'top1 agree':>12}{'max |dlogit|':>14}")
+    report = {}
+    for name, model in variants.items():
+        logits = reference if name == "eager" else run_model(model, inputs, batch_size)
+        top1 = logits.argmax(dim=1)
+        report[name] = {
+            "accuracy": (top1 == labels).float().mean().item(),
+            "top1_agreement": (top1 == reference_top1).float().mean().item(),
+            "max_abs_logit_diff": (logits - reference).abs().max().item(),
+        }
+        r = report[name]
+        print(f"{name:<14}{r['accuracy']:>10.4f}{r['top1_agreement']:>12.4f}{r['max_abs_logit_diff']:>14.5f}")
+    return report
+
+
+def benchmark(variants, cfg, batch_sizes=(1, 8, 32), iterations=20):
+    """Per-batch latency (p50) and images/sec for every variant."""
+    print(f"{'variant':<14}{'batch':>6}{'p50 ms':>10}{'img/s':>10}")
+    for name, model in variants.items():
+        for batch_size in batch_sizes:
+            x = example_input(cfg, batch_size)
+            with torch.no_grad():
+                for _ in range(3):
+                    model(x)
+                timings = []
+                for _ in range(iterations):
+                    start = time.perf_counter()
+                    model(x)
+                    timings.append(time.perf_counter() - start)
+            p50 = float(np.median(timings))
+            print(f"{name:<14}{batch_size:>6}{p50 * 1000:>10.1f}{batch_size / p50:>10.1f}")
+
+
+# ============================================================
+# CLI
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formats", nargs="+", choices=["torchscript", "onnx"], default=["torchscript"])
+    parser.add_argument("--quantize", choices=["none", "static"], default="none")
+    parser.add_argument("--calibration-dir", help="Image folder used to calibrate static quantization")
+    parser.add_argument("--calibration-images", type=int, default=256)
+    parser.add_argument("--parity-dir", help="Held-out image folder (<class>/<image>) for the accuracy-parity check")
+    parser.add_argument("--benchmark", action="store_true", help="Compare latency/throughput of all variants")
+    parser.add_argument("--out-dir", help="Where to write artifacts (defaults to Config.save_dir)")
+    args = parser.parse_args()
+
+    predictor = Predictor(backend="eager")
+    cfg = predictor.config
+    model = predictor.model
+    out_dir = args.out_dir or cfg.save_dir
+    os.makedirs(out_dir, exist_ok=True)
+
+    variants = {"eager": model}
+    if "torchscript" in args.formats:
+        variants["scripted"] = export_torchscript(model, cfg, os.path.join(out_dir, "model.ts"))
+    if "onnx" in args.formats:
+        onnx_path = os.path.join(out_dir, "model.onnx")
+        export_onnx(model, cfg, onnx_path)
+        try:
+            variants["onnx"] = OnnxModel(onnx_path)
+        except RuntimeError as e:
+            print(f"[Export] Skipping ONNX parity/benchmark: {e}")
+
+    if args.quantize == "static":
+        if not args.calibration_dir:
+            parser.error("--quantize static needs --calibration-dir")
+        calibration, _ = load_image_folder(args.calibration_dir, predictor, limit=args.calibration_images)
+        quantized = quantize_static(model, cfg, batches(calibration, cfg.batch_size))
+        variants["int8-static"] = export_torchscript(quantized, cfg, os.path.join(out_dir, "model_int8_static.ts"),
+                                                     optimize=False)
+
+    if args.parity_dir:
+        inputs, labels = load_image_folder(args.parity_dir, predictor)
+        parity_report(variants, inputs, labels, batch_size=cfg.batch_size)
+
+    if args.benchmark:
+        benchmark(variants, cfg)
+
+
+if __name__ == "__main__":
+    main()
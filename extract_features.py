@@ -0,0 +1,216 @@
+"""
+Offline backbone feature extraction: run DenseNetBackbone once over the image
+folders and cache its (128, 4, 4) projected features for head-only training.
+
+    python -m ai_model.extract_features [--splits train val test] [--batch-size 64]
+    python -m ai_model.train --cached-features
+
+Input is Config.image_dir/<split>/<class>/<image>; output is a
+ProtoFeatureDataset folder Config.feature_dir/<split>/<class>/<hash>.pt
+(pack it with feature_shards.py for the fastest reads). Each output file is
+named after the SHA-256 of the image bytes, so re-running only extracts new or
+changed images, removes outputs whose source image is gone, and an interrupted
+run resumes where it stopped (files are written atomically). Every split
+directory is stamped with a fingerprint of the backbone weights; if the
+backbone changes, that split is re-extracted from scratch.
+
+Images are decoded on ImagePreprocessor's thread pool one batch ahead of the
+forward pass, so decoding overlaps the backbone.
+"""
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from tqdm import tqdm
+
+from .coin_classifier import Config, ProtoPNet
+from .predictor import load_checkpoint
+from .preprocessing import IMAGE_EXTENSIONS, ImagePreprocessor
+
+STAMP_FILE = "backbone.json"
+
+
+# ============================================================
+# FINGERPRINTS
+# ============================================================
+def backbone_fingerprint(model):
+    """Content hash of the backbone weights; cached features are only valid for this exact backbone."""
+    h = hashlib.sha256()
+    for name, tensor in sorted(model.features.state_dict().items()):
+        h.update(name.encode())
+        h.update(tensor.detach().cpu().reshape(-1).view(torch.uint8).numpy().tobytes())
+    return h.hexdigest()[:16]
+
+
+def read_stamp(split_dir):
+    try:
+        with open(os.path.join(split_dir, STAMP_FILE)) as f:
+            return json.load(f).get("backbone")
+    except (OSError, ValueError):
+        return None
+
+
+def write_stamp(split_dir, fingerprint):
+    with open(os.path.join(split_dir, STAMP_FILE), "w") as f:
+        json.dump({"backbone": fingerprint}, f)
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:32]
+
+
+# ============================================================
+# EXTRACTION
+# ============================================================
+def list_images(image_dir):
+    images = []
+    for cls in sorted(os.listdir(image_dir)):
+        cls_dir = os.path.join(image_dir, cls)
+        if not os.path.isdir(cls_dir):
+            continue
+        for name in sorted(os.listdir(cls_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                images.append((cls, os.path.join(cls_dir, name)))
+    return images
+
+
+def existing_outputs(out_dir):
+    outputs = set()
+    for cls in os.listdir(out_dir):
+        cls_dir = os.path.join(out_dir, cls)
+        if os.path.isdir(cls_dir):
+            outputs.update(os.path.join(cls_dir, f) for f in os.listdir(cls_dir) if f.endswith(".pt"))
+    return outputs
+
+
+def save_feature(tensor, path):
+    tmp = f"{path}.tmp"
+    # clone() so each file holds its own [128, 4, 4] and not the whole batch's storage
+    torch.save(tensor.clone(), tmp)
+    os.replace(tmp, path)
+
+
+def extract_split(model, preprocessor, image_dir, out_dir, fingerprint, batch_size=64, hash_pool=None):
+    """Brings `out_dir` in line with `image_dir`; returns counts of reused/extracted/removed/failed images."""
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = read_stamp(out_dir)
+    if stamp is not None and stamp != fingerprint:
+        print(f"[Features] Backbone changed since {out_dir} was extracted ({stamp} -> {fingerprint}); redoing it.")
+        for path in existing_outputs(out_dir):
+            os.remove(path)
+    write_stamp(out_dir, fingerprint)
+
+    images = list_images(image_dir)
+    digests = list((hash_pool.map if hash_pool else map)(file_digest, [path for _, path in images]))
+    targets = {}
+    for (cls, path), digest in zip(images, digests):
+        targets.setdefault(os.path.join(out_dir, cls, f"{digest}.pt"), path)
+
+    existing = existing_outputs(out_dir)
+    stale = existing - targets.keys()
+    for path in stale:
+        os.remove(path)
+    todo = [(target, source) for target, source in targets.items() if target not in existing]
+    counts = {"reused": len(targets) - len(todo), "extracted": 0, "removed": len(stale), "failed": 0}
+    if not todo:
+        return counts
+
+    for cls in {os.path.basename(os.path.dirname(target)) for target, _ in todo}:
+        os.makedirs(os.path.join(out_dir, cls), exist_ok=True)
+
+    def decode(chunk):
+        images = []
+        for _, source in chunk:
+            with open(source, "rb") as f:
+                images.append(f.read())
+        return preprocessor.preprocess_batch(images)
+
+    chunks = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="feature-decode") as reader, \
+            tqdm(total=len(todo), desc=f"Extracting {image_dir}") as progress:
+        pending = reader.submit(decode, chunks[0])
+        for i, chunk in enumerate(chunks):
+            batch, errors = pending.result()
+            if i + 1 < len(chunks):
+                pending = reader.submit(decode, chunks[i + 1])
+
+            for j, e in errors.items():
+                print(f"[Features] Skipping {chunk[j][1]}: {e}")
+            ok = [item for j, item in enumerate(chunk) if j not in errors]
+            if ok:
+                with torch.inference_mode():
+                    features = model.features(batch.to(next(model.parameters()).device)).cpu()
+                for (target, _), feature in zip(ok, features):
+                    save_feature(feature, target)
+
+            counts["extracted"] += len(ok)
+            counts["failed"] += len(errors)
+            progress.update(len(chunk))
+    return counts
+
+
+def backbone_source(cfg):
+    """The weights features are extracted with: the trained checkpoint if there is one, else the start point."""
+    return cfg.save_path if os.path.exists(cfg.save_path) else cfg.backbone_init_path
+
+
+def load_backbone_model(cfg, num_classes):
+    """
+    The checkpoint's backbone. With no checkpoint yet, an ImageNet-initialised
+    model saved to Config.backbone_init_path, which `train.py --cached-features`
+    then starts from. Config.save_path is what Predictor serves, so it is never
+    written here.
+    """
+    path = backbone_source(cfg)
+    if os.path.exists(path):
+        model = ProtoPNet(cfg, num_classes, pretrained_backbone=False)
+        model.load_state_dict(load_checkpoint(path))
+    else:
+        print(f"[Features] No checkpoint at {cfg.save_path}; using an ImageNet backbone, saved to {path} "
+              f"so head-only training starts from the same weights.")
+        model = ProtoPNet(cfg, num_classes)
+        tmp = f"{path}.tmp"
+        torch.save(model.state_dict(), tmp)
+        os.replace(tmp, path)
+    return model.to(cfg.device).eval()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--splits", nargs="+", default=["train", "val", "test"])
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    cfg = Config()
+    train_images = os.path.join(cfg.image_dir, "train")
+    if not os.path.isdir(train_images):
+        raise SystemExit(f"[Features] No training images at {train_images}; expected "
+                         f"<image_dir>/train/<class>/<image> (Config.image_dir).")
+    classes = sorted(d for d in os.listdir(train_images) if os.path.isdir(os.path.join(train_images, d)))
+    if not classes:
+        raise SystemExit(f"[Features] {train_images} has no class folders.")
+    model = load_backbone_model(cfg, len(classes))
+    fingerprint = backbone_fingerprint(model)
+    preprocessor = ImagePreprocessor(cfg)
+
+    with ThreadPoolExecutor(thread_name_prefix="feature-hash") as hash_pool:
+        for split in args.splits:
+            image_dir = os.path.join(cfg.image_dir, split)
+            if not os.path.isdir(image_dir):
+                print(f"[Features] {image_dir} not found; skipping {split}.")
+                continue
+            counts = extract_split(model, preprocessor, image_dir, os.path.join(cfg.feature_dir, split),
+                                   fingerprint, batch_size=args.batch_size, hash_pool=hash_pool)
+            print(f"[Features] {split}: {counts['extracted']} extracted, {counts['reused']} reused, "
+                  f"{counts['removed']} removed, {counts['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Contiguous, memory-mapped feature shards for training.
+
+    python -m ai_model.feature_shards <root_dir> <out_dir> [--shard-size 8192] [--dtype float16]
+
+Packs a ProtoFeatureDataset folder (<root_dir>/<class>/<sample>.pt) into a few
+fixed-shape .npy shards plus a label array and an index.json. Reading a sample
+is then a slice of a memory-mapped file: no per-sample open() or torch.load,
+random access is O(1), and DataLoader workers share the OS page cache instead
+of each holding its own copy of the data.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from tqdm import tqdm
+
+from .coin_classifier import ProtoFeatureDataset
+
+INDEX_FILE = "index.json"
+LABELS_FILE = "labels.npy"
+
+
+# ============================================================
+# PACKING
+# ============================================================
+def pack_feature_shards(root_dir, out_dir, shard_size=8192, dtype="float16"):
+    """Writes every sample of `root_dir` into `out_dir` as shards of `shard_size` samples."""
+    source = ProtoFeatureDataset(root_dir)
+    if not source.samples:
+        raise RuntimeError(f"No .pt samples found under {root_dir}")
+
+    os.makedirs(out_dir, exist_ok=True)
+    sample_shape = tuple(torch.load(source.samples[0][0]).shape)
+    total = len(source.samples)
+
+    labels = np.lib.format.open_memmap(os.path.join(out_dir, LABELS_FILE), mode="w+", dtype=np.int64,
+                                       shape=(total,))
+    shards = []
+    shard = None
+    for i, (path, label) in enumerate(tqdm(source.samples, desc=f"Packing {root_dir}")):
+        offset = i % shard_size
+        if offset == 0:
+            if shard is not None:
+                shard.flush()
+            count = min(shard_size, total - i)
+            name = f"shard_{len(shards):05d}.npy"
+            shard = np.lib.format.open_memmap(os.path.join(out_dir, name), mode="w+", dtype=dtype,
+                                              shape=(count,) + sample_shape)
+            shards.append({"file": name, "count": count})
+
+        x = torch.load(path)
+        if tuple(x.shape) != sample_shape:
+            raise RuntimeError(f"{path} has shape {tuple(x.shape)}, expected {sample_shape}")
+        shard[offset] = x.float().numpy()
+        labels[i] = label
+
+    shard.flush()
+    labels.flush()
+
+    index = {
+        "total": total,
+        "shard_size": shard_size,
+        "sample_shape": list(sample_shape),
+        "dtype": dtype,
+        "classes": source.classes,
+        "shards": shards,
+    }
+    with open(os.path.join(out_dir, INDEX_FILE), "w") as f:
+        json.dump(index, f, indent=2)
+    print(f"Packed {total} samples into {len(shards)} shards in {out_dir}")
+    return index
+
+
+# ============================================================
+# DATASET
+# ============================================================
+class ShardedFeatureDataset(Dataset):
+    """
+    Drop-in replacement for ProtoFeatureDataset reading packed shards.
+
+    Shards are memory-mapped lazily in whichever process first touches them,
+    so the dataset pickles cheaply to DataLoader workers and every worker maps
+    the same files (one copy in the page cache) rather than copying tensors.
+    """
+
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        with open(os.path.join(shard_dir, INDEX_FILE)) as f:
+            self.index = json.load(f)
+
+        self.classes = self.index["classes"]
+        self.class_to_idx = {c: i for i, c in enumerate(self.classes)}
+        self.shard_size = self.index["shard_size"]
+        self.labels = np.load(os.path.join(shard_dir, LABELS_FILE), mmap_mode="r")
+        self._shards = None
+
+    def __getstate__(self):
+        # Don't ship open memory maps to worker processes; they re-map on first access
+        state = self.__dict__.copy()
+        state["_shards"] = None
+        state["labels"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.labels = np.load(os.path.join(self.shard_dir, LABELS_FILE), mmap_mode="r")
+
+    def _shard_arrays(self):
+        if self._shards is None:
+            # Copy-on-write maps: torch.from_numpy wants writable arrays, and a float32 sample
+            # is returned without a copy, so in-place edits must not reach the file
+            self._shards = [
+                np.load(os.path.join(self.shard_dir, shard["file"]), mmap_mode="c")
+                for shard in self.index["shards"]
+            ]
+        return self._shards
+
+    def __len__(self):
+        return self.index["total"]
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"sample index out of range for {len(self)} samples")
+        shard, offset = divmod(idx, self.shard_size)
+        # The slice is a view into the mapped file; only the float32 cast copies (one sample)
+        x = torch.from_numpy(np.asarray(self._shard_arrays()[shard][offset])).float()
+        return x, int(self.labels[idx])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root_dir", help="ProtoFeatureDataset folder: <class>/<sample>.pt")
+    parser.add_argument("out_dir", help="Where to write the shards")
+    parser.add_argument("--shard-size", type=int, default=8192)
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float16")
+    args = parser.parse_args()
+    pack_feature_shards(args.root_dir, args.out_dir, shard_size=args.shard_size, dtype=args.dtype)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from types import SimpleNamespace
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from .image_finder import normalize_string
+
+# --- Ranking settings ---
+# Dynasty and king names are short and decisive, so a hit there outweighs one in the details text
+FIELD_WEIGHTS = {'dynasty': 2.0, 'king_name': 2.0, 'details': 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# A short query term like "k" could otherwise expand to most of the vocabulary
+MAX_PREFIX_EXPANSIONS = 64
+
+# Session.info slot holding index changes flushed but not yet committed
+PENDING_CHANGES = 'catalogue_index_changes'
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Splits text into search terms, folding diacritics the same way image_finder does."""
+    return TOKEN_RE.findall(normalize_string(text)) if text else []
+
+
+class CatalogueIndex:
+    """
+    In-process inverted index over every period's key and coin tables.
+
+    Each coin is one document made of its key's dynasty and king name plus its
+    own details text. Query terms match whole words or word prefixes and
+    results are ranked with field-weighted BM25. The index is built once at
+    startup and then kept current by ORM events, so no query touches the
+    database.
+
+    Changes are recorded when they are flushed and applied only once their
+    session commits, so a rollback leaves the index untouched. The index
+    lives in each process: under a pre-fork server (serve.py) a worker only
+    sees catalogue writes made through its own sessions, and changes made in
+    other workers or directly in MySQL appear after a restart (or the next
+    worker rotation).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._listening = set()  # models (and the Session class) already subscribed
+        self._reset()
+
+    def _reset(self):
+        self._postings = defaultdict(dict)   # term -> {doc_id: weighted term frequency}
+        self._doc_terms = {}                 # doc_id -> {term: weighted term frequency}
+        self._doc_lengths = {}               # doc_id -> weighted length
+        self._docs = {}                      # doc_id -> result dict, doc_id = (period, s_no)
+        self._keys = defaultdict(dict)       # period -> {key code: (dynasty, king_name)}
+        self._key_codes = {}                 # (period, key id) -> key code, to spot code changes
+        self._total_length = 0.0
+        self._vocabulary = []
+        self._vocabulary_dirty = False
+        self._norms = {}                     # doc_id -> BM25 length normalisation, rebuilt lazily
+        self._norms_dirty = False
+        self.ready = False
+
+    # --- Building ---
+    def build(self, model_map, table_exists=None):
+        """Loads every key and coin (two queries per period) and indexes them."""
+        with self._lock:
+            self._reset()
+            for period, models in model_map.items():
+                KeyModel, DataModel = models['keys'], models['data']
+                if table_exists and not (table_exists(KeyModel.__tablename__)
+                                         and table_exists(DataModel.__tablename__)):
+                    continue
+                for key in KeyModel.query.all():
+                    self._set_key(period, key)
+                for coin in DataModel.query.all():
+                    self._index_coin(period, coin.s_no, coin.code, coin.details)
+
+            self.ready = True
+            print(f"[Full-text] Indexed {len(self._docs)} coins, {len(self._postings)} distinct terms.")
+
+    def register_listeners(self, model_map):
+        """
+        Keeps the index in step with committed inserts, updates and deletes
+        made through the ORM. Safe to call again (e.g. from a second
+        create_app): models already subscribed are skipped.
+        """
+        with self._lock:
+            if Session not in self._listening:
+                event.listen(Session, 'after_commit', self._apply_pending)
+                event.listen(Session, 'after_rollback', self._discard_pending)
+                self._listening.add(Session)
+
+            for period, models in model_map.items():
+                KeyModel, DataModel = models['keys'], models['data']
+                if KeyModel not in self._listening:
+                    self._listen(KeyModel, period, self.update_key, self.remove_key,
+                                 lambda key: SimpleNamespace(id=key.id, code=key.code, dynasty=key.dynasty,
+                                                             king_name=key.king_name))
+                    self._listening.add(KeyModel)
+                if DataModel not in self._listening:
+                    self._listen(DataModel, period, self.update_coin,
+                                 lambda period, coin: self.remove_coin(period, coin.s_no),
+                                 lambda coin: SimpleNamespace(s_no=coin.s_no, code=coin.code, details=coin.details))
+                    self._listening.add(DataModel)
+
+    def _listen(self, model, period, on_change, on_delete, snapshot):
+        # Values are copied at flush time: after the commit the ORM objects are expired
+        def changed(mapper, connection, target):
+            self._record(target, on_change, period, snapshot(target))
+
+        def deleted(mapper, connection, target):
+            self._record(target, on_delete, period, snapshot(target))
+
+        event.listen(model, 'after_insert', changed)
+        event.listen(model, 'after_update', changed)
+        event.listen(model, 'after_delete', deleted)
+
+    @staticmethod
+    def _record(target, apply, period, row):
+        session = object_session(target)
+        if session is None:
+            apply(period, row)
+        else:
+            session.info.setdefault(PENDING_CHANGES, []).append((apply, period, row))
+
+    @staticmethod
+    def _apply_pending(session):
+        for apply, period, row in session.info.pop(PENDING_CHANGES, ()):
+            apply(period, row)
+
+    @staticmethod
+    def _discard_pending(session):
+        session.info.pop(PENDING_CHANGES, None)
+
+    # --- Incremental updates ---
+    def update_coin(self, period, coin):
+        with self._lock:
+            self._index_coin(period, coin.s_no, coin.code, coin.details)
+
+    def remove_coin(self, period, s_no):
+        with self._lock:
+            self._remove_doc((period, s_no))
+
+    def update_key(self, period, key):
+        with self._lock:
+            old_code = self._key_codes.get((period, key.id))
+            if old_code is not None and old_code != key.code:
+                self._keys[period].pop(old_code, None)
+            self._set_key(period, key)
+            self._reindex_prefix(period, [c for c in (old_code, key.code) if c])
+
+    def remove_key(self, period, key):
+        with self._lock:
+            code = self._key_codes.pop((period, key.id), key.code)
+            self._keys[period].pop(code, None)
+            if code:
+                self._reindex_prefix(period, [code])
+
+    # --- Querying ---
+    def search(self, query, limit=None):
+        """Returns (result dict, score) pairs, best first. Every query term may match as a word prefix."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            if self._vocabulary_dirty:
+                self._vocabulary = sorted(self._postings)
+                self._vocabulary_dirty = False
+
+            doc_count = len(self._docs)
+            if not doc_count:
+                return []
+            if self._norms_dirty:
+                avg_length = self._total_length / doc_count
+                self._norms = {
+                    doc_id: BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                    for doc_id, length in self._doc_lengths.items()
+                }
+                self._norms_dirty = False
+
+            norms = self._norms
+            scores = defaultdict(float)
+            for term in set(terms):
+                for match in self._expand(term):
+                    postings = self._postings[match]
+                    idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    boost = idf * (BM25_K1 + 1)
+                    for doc_id, tf in postings.items():
+                        scores[doc_id] += boost * tf / (tf + norms[doc_id])
+
+            order = lambda item: (-item[1], item[0])
+            if limit:
+                ranked = heapq.nsmallest(limit, scores.items(), key=order)
+            else:
+                ranked = sorted(scores.items(), key=order)
+            return [(dict(self._docs[doc_id]), score) for doc_id, score in ranked]
+
+    # --- Internals (callers hold self._lock) ---
+    def _expand(self, term):
+        """Vocabulary terms starting with `term`, exact match first."""
+        matches = []
+        for i in range(bisect_left(self._vocabulary, term), len(self._vocabulary)):
+            candidate = self._vocabulary[i]
+            if not candidate.startswith(term) or len(matches) >= MAX_PREFIX_EXPANSIONS:
+                break
+            if self._postings.get(candidate):
+                matches.append(candidate)
+        return matches
+
+    def _set_key(self, period, key):
+        self._keys[period][key.code] = (key.dynasty, key.king_name)
+        self._key_codes[(period, key.id)] = key.code
+
+    def _key_for_code(self, period, code):
+        # Codes are at most 10 characters, so trying each prefix is a handful of dict lookups
+        keys = self._keys.get(period, {})
+        for end in range(len(code or ''), 0, -1):
+            info = keys.get(code[:end])
+            if info is not None:
+                return info
+        return None
+
+    def _reindex_prefix(self, period, prefixes):
+        for doc_id, doc in list(self._docs.items()):
+            if doc_id[0] == period and any((doc['code'] or '').startswith(p) for p in prefixes):
+                self._index_coin(period, doc['s_no'], doc['code'], doc['details'])
+
+    def _index_coin(self, period, s_no, code, details):
+        doc_id = (period, s_no)
+        self._remove_doc(doc_id)
+
+        key_info = self._key_for_code(period, code)
+        dynasty, king_name = key_info if key_info else ('N/A', 'N/A')
+        fields = {'dynasty': dynasty if key_info else '', 'king_name': king_name if key_info else '',
+                  'details': details}
+
+        term_weights = defaultdict(float)
+        for field, text in fields.items():
+            for term in tokenize(text):
+                term_weights[term] += FIELD_WEIGHTS[field]
+
+        for term, weight in term_weights.items():
+            if term not in self._postings:
+                self._vocabulary_dirty = True
+            self._postings[term][doc_id] = weight
+
+        length = sum(term_weights.values())
+        self._norms_dirty = True
+        self._doc_terms[doc_id] = term_weights
+        self._doc_lengths[doc_id] = length
+        self._total_length += length
+        self._docs[doc_id] = {
+            's_no': s_no,
+            'code': code,
+            'details': details,
+            'dynasty': dynasty,
+            'king_name': king_name,
+            'period': period,
+        }
+
+    def _remove_doc(self, doc_id):
+        term_weights = self._doc_terms.pop(doc_id, None)
+        if term_weights is None:
+            return
+        for term in term_weights:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+                    self._vocabulary_dirty = True
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        self._norms_dirty = True
+        del self._docs[doc_id]
+
+
+catalogue_index = CatalogueIndex()
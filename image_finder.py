@@ -1,6 +1,10 @@
 import os
+import threading
+import time
 import unicodedata
 
+from .metrics import span
+
 
 def normalize_string(s):
     """
@@ -14,80 +18,133 @@ def normalize_string(s):
     return s.lower().strip()
 
 
-def find_image_path(coin_data_dict):
-    """
-    Constructs and verifies the path for a coin image by searching for folders
-    that match, ignoring minor whitespace or character differences.
-    """
-    dynasty = coin_data_dict.get('dynasty')
-    king_name = coin_data_dict.get('king_name')
-    code = coin_data_dict.get('code')
-
-    if not all([dynasty, king_name, code]):
-        return None
-
-    time_period = "Ancient India"
-
-    try:
-        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-
-        # --- NEW ROBUST PATH FINDING ---
-
-        # 1. Start at the 'asset' folder
-        asset_path = os.path.join(base_dir, 'static', 'asset')
-        if not os.path.isdir(asset_path):
-            return None
+# How often (seconds) lookups re-check folder mtimes for added/removed images
+REFRESH_INTERVAL = 30
 
-        # 2. Find the 'coin image' folder, ignoring leading/trailing spaces
-        coin_image_folder_name = None
-        for folder in os.listdir(asset_path):
-            if folder.strip() == 'coin image':
-                coin_image_folder_name = folder
-                break
+ASSET_DIR = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), 'static', 'asset')
 
-        if not coin_image_folder_name:
-            return None  # Could not find the main 'coin image' directory
 
-        # 3. Build the path to the Time Period folder
-        time_period_path = os.path.join(asset_path, coin_image_folder_name, time_period)
-        if not os.path.isdir(time_period_path):
-            return None
+class ImagePathIndex:
+    """
+    Maps (dynasty, code) to the coin images on disk for every time period, so a
+    lookup is a dict access instead of a directory walk.
 
-        # 4. Find the correct dynasty folder by comparing normalized names
-        dynasty_folder_name = None
-        normalized_db_dynasty = normalize_string(dynasty)
-        for folder in os.listdir(time_period_path):
-            if normalize_string(folder) == normalized_db_dynasty:
-                dynasty_folder_name = folder
-                break
+    The folder tree is scanned once; afterwards lookups re-stat the folders at
+    most every REFRESH_INTERVAL seconds and rescan only if one of their mtimes
+    changed (adding or removing an entry updates its parent folder's mtime).
+    """
 
-        if not dynasty_folder_name:
+    def __init__(self, asset_dir=ASSET_DIR, refresh_interval=REFRESH_INTERVAL):
+        self.asset_dir = asset_dir
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._entries = {}      # (normalized dynasty, code) -> [(normalized king, normalized period, url)]
+        self._mtimes = {}       # folder path -> mtime seen at the last scan
+        self._next_check = 0.0
+
+    def lookup(self, dynasty, king_name, code, period=None):
+        """Returns the image URL for a coin, or None. `period` ('ancient', ...) narrows the match."""
+        self._maybe_refresh()
+        candidates = self._entries.get((normalize_string(dynasty), code))
+        if not candidates:
             return None
 
-        # 5. Find the king's folder inside the found dynasty folder
-        dynasty_path = os.path.join(time_period_path, dynasty_folder_name)
-        king_folder_name = None
-        normalized_db_king = normalize_string(king_name)
-        for folder in os.listdir(dynasty_path):
-            if normalize_string(folder).startswith(normalized_db_king):
-                king_folder_name = folder
-                break
+        normalized_king = normalize_string(king_name)
+        normalized_period = normalize_string(period)
+        fallback = None
+        for folder_king, folder_period, url in candidates:
+            if not folder_king.startswith(normalized_king):
+                continue
+            if not normalized_period or folder_period.startswith(normalized_period):
+                return url
+            fallback = fallback or url
+        return fallback
+
+    def refresh(self):
+        """Rescans the image tree and swaps in the new index."""
+        entries, mtimes = {}, {}
+        coin_image_folder_name, root = self._find_root(mtimes)
+        if root:
+            for time_period in self._subfolders(root, mtimes):
+                period_path = os.path.join(root, time_period)
+                normalized_period = normalize_string(time_period)
+                for dynasty_folder_name in self._subfolders(period_path, mtimes):
+                    dynasty_path = os.path.join(period_path, dynasty_folder_name)
+                    normalized_dynasty = normalize_string(dynasty_folder_name)
+                    for king_folder_name in self._subfolders(dynasty_path, mtimes):
+                        king_path = os.path.join(dynasty_path, king_folder_name)
+                        normalized_king = normalize_string(king_folder_name)
+                        mtimes[king_path] = os.stat(king_path).st_mtime
+                        for filename in os.listdir(king_path):
+                            if not filename.endswith('.jpg'):
+                                continue
+                            code = filename[:-len('.jpg')]
+                            url = (f"/static/asset/{coin_image_folder_name}/{time_period}/"
+                                   f"{dynasty_folder_name}/{king_folder_name}/{filename}")
+                            entries.setdefault((normalized_dynasty, code), []).append(
+                                (normalized_king, normalized_period, url))
+
+        with self._lock:
+            self._entries = entries
+            self._mtimes = mtimes
+            self._next_check = time.monotonic() + self.refresh_interval
+        return len(entries)
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            # Other lookups keep using the current index while this thread checks
+            self._next_check = now + self.refresh_interval
+            mtimes = dict(self._mtimes)
+
+        try:
+            changed = not mtimes or any(os.stat(path).st_mtime != mtime for path, mtime in mtimes.items())
+        except OSError:
+            changed = True
+        if changed:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[Image Finder] Failed to rebuild image index: {e}")
+
+    def _find_root(self, mtimes):
+        # The 'coin image' folder is matched ignoring leading/trailing spaces
+        if not os.path.isdir(self.asset_dir):
+            return None, None
+        mtimes[self.asset_dir] = os.stat(self.asset_dir).st_mtime
+        for folder in os.listdir(self.asset_dir):
+            if folder.strip() == 'coin image' and os.path.isdir(os.path.join(self.asset_dir, folder)):
+                return folder, os.path.join(self.asset_dir, folder)
+        return None, None
+
+    @staticmethod
+    def _subfolders(path, mtimes):
+        mtimes[path] = os.stat(path).st_mtime
+        return [f for f in os.listdir(path) if os.path.isdir(os.path.join(path, f))]
+
+
+image_index = ImagePathIndex()
 
-        if not king_folder_name:
-            return None
 
-        # 6. Construct and check the final path
-        image_filesystem_path = os.path.join(dynasty_path, king_folder_name, f"{code}.jpg")
+def find_image_path(coin_data_dict):
+    """
+    Returns the URL of a coin's image, matching dynasty and king folders
+    ignoring case, diacritics and minor whitespace differences.
+    """
+    dynasty = coin_data_dict.get('dynasty')
+    king_name = coin_data_dict.get('king_name')
+    code = coin_data_dict.get('code')
 
-        if os.path.exists(image_filesystem_path):
-            # Use the actual folder names we found for the URL
-            image_url_path = f"/static/asset/{coin_image_folder_name}/{time_period}/{dynasty_folder_name}/{king_folder_name}/{code}.jpg"
-            return image_url_path
-        else:
-            return None
+    if not all([dynasty, king_name, code]):
+        return None
 
+    try:
+        with span("image_lookup"):
+            return image_index.lookup(dynasty, king_name, code, coin_data_dict.get('period'))
     except Exception as e:
         print(f"[Image Finder] An unexpected error occurred: {e}")
         return None
-
-    
\ No newline at end of file
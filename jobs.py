@@ -0,0 +1,220 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+from .cache import CACHE_DIR
+
+JOBS_DB_PATH = os.path.join(CACHE_DIR, 'jobs.sqlite3')
+
+# --- Worker settings ---
+JOB_WORKERS = 4              # Jobs run at the same time per process
+JOB_RETENTION = 3600         # Seconds finished jobs stay pollable before being purged
+JOB_STALE_AFTER = 600        # Seconds after which a 'running' job is assumed orphaned by a dead process
+METRICS_WINDOW = 500         # Recent jobs used for the latency figures
+
+
+class JobQueue:
+    """
+    Persistent background job queue backed by SQLite.
+
+    Endpoints submit work and return straight away with the job id; a fixed
+    pool of worker threads (started on first use, or by resume() at start-up)
+    claims queued jobs and runs the handler registered for their kind. Jobs
+    survive restarts: anything left 'running' by a crashed process is
+    re-queued at start-up. A job
+    submitted while an identical one (same dedupe key) is still queued or
+    running is folded into the existing job.
+    """
+
+    def __init__(self, db_path=JOBS_DB_PATH, workers=JOB_WORKERS):
+        self.db_path = db_path
+        self.workers = workers
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads = []
+        self._threads_pid = None
+        self._wait_times = deque(maxlen=METRICS_WINDOW)
+        self._run_times = deque(maxlen=METRICS_WINDOW)
+        self._deduplicated = 0
+        self._last_purge = 0.0
+        self._connection = None
+        self._connection_pid = None
+
+    @property
+    def _db(self):
+        # Opened lazily and per process: a SQLite handle must not be shared across fork()
+        if self._connection is None or self._connection_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, kind TEXT NOT NULL, dedupe_key TEXT, payload TEXT NOT NULL,"
+                " status TEXT NOT NULL, result TEXT, error TEXT,"
+                " created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, created_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS ix_jobs_dedupe ON jobs (dedupe_key, status)")
+            self._connection = db
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def register_handler(self, kind, handler):
+        """`handler(payload)` runs on a worker thread; its return value must be JSON-serialisable."""
+        self._handlers[kind] = handler
+
+    def submit(self, kind, payload, dedupe_key=None):
+        """Queues a job and returns its id (or the id of an identical in-flight job)."""
+        self._ensure_workers()
+        with self._lock:
+            if dedupe_key is not None:
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running') LIMIT 1",
+                    (dedupe_key,)
+                ).fetchone()
+                if row:
+                    self._deduplicated += 1
+                    return row[0]
+
+            job_id = uuid.uuid4().hex
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, dedupe_key, payload, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, dedupe_key, json.dumps(payload), time.time())
+            )
+            self._wakeup.notify()
+            return job_id
+
+    def resume(self):
+        """
+        Starts this process's workers if the database still holds unfinished
+        jobs (e.g. from before a restart), instead of waiting for the next submit().
+        """
+        with self._lock:
+            unfinished = self._db.execute(
+                "SELECT 1 FROM jobs WHERE status = 'queued'"
+                " OR (status = 'running' AND started_at < ?) LIMIT 1", (time.time() - JOB_STALE_AFTER,)
+            ).fetchone()
+        if unfinished:
+            print("[Jobs] Resuming unfinished jobs from a previous run.")
+            self._ensure_workers()
+
+    def get(self, job_id):
+        """Returns the job's status (and result once finished), or None if unknown."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, status, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        job = {
+            'job_id': row[0],
+            'kind': row[1],
+            'status': row[2],
+            'created_at': row[5],
+            'started_at': row[6],
+            'finished_at': row[7],
+        }
+        if row[3] is not None:
+            job['result'] = json.loads(row[3])
+        if row[4] is not None:
+            job['error'] = row[4]
+        return job
+
+    def metrics(self):
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            wait_times = sorted(self._wait_times)
+            run_times = sorted(self._run_times)
+
+        def percentile(values, q):
+            return round(values[min(len(values) - 1, int(q * len(values)))], 4) if values else None
+
+        return {
+            'queue_depth': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'deduplicated': self._deduplicated,
+            'workers': self.workers,
+            'wait_seconds': {'p50': percentile(wait_times, 0.5), 'p95': percentile(wait_times, 0.95)},
+            'run_seconds': {'p50': percentile(run_times, 0.5), 'p95': percentile(run_times, 0.95)},
+        }
+
+    def _ensure_workers(self):
+        # Threads don't survive fork(): a forked server worker starts its own
+        if self._threads and self._threads_pid == os.getpid():
+            return
+        with self._lock:
+            if self._threads and self._threads_pid == os.getpid():
+                return
+            self._threads = []
+            self._threads_pid = os.getpid()
+            # Jobs a dead process left 'running' get another go. Only stale ones: other live
+            # processes may share this database and still be working on recent jobs.
+            self._db.execute("UPDATE jobs SET status = 'queued', started_at = NULL"
+                             " WHERE status = 'running' AND started_at < ?", (time.time() - JOB_STALE_AFTER,))
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _claim(self):
+        """Atomically marks the oldest queued job as running and returns it, waiting if there is none."""
+        with self._lock:
+            while True:
+                row = self._db.execute(
+                    "SELECT id, kind, payload, created_at FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    # The status guard keeps a worker in another process from claiming it twice
+                    claimed = self._db.execute(
+                        "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                        (time.time(), row[0])
+                    ).rowcount
+                    if claimed:
+                        return row
+                    continue
+                self._purge_finished()
+                # Other processes may enqueue into the same database, so poll as well as wait
+                self._wakeup.wait(timeout=1.0)
+
+    def _work(self):
+        while True:
+            job_id, kind, payload, created_at = self._claim()
+            started = time.time()
+            handler = self._handlers.get(kind)
+            result, error = None, None
+            try:
+                if handler is None:
+                    raise RuntimeError(f"No handler registered for job kind '{kind}'")
+                result = json.dumps(handler(json.loads(payload)))
+            except Exception as e:
+                print(f"[Jobs] Job {job_id} ({kind}) failed: {e}")
+                error = str(e)
+
+            finished = time.time()
+            with self._lock:
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                    ('failed' if error else 'done', result, error, finished, job_id)
+                )
+                self._wait_times.append(started - created_at)
+                self._run_times.append(finished - started)
+
+    def _purge_finished(self):
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        self._db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                         (now - JOB_RETENTION,))
+
+
+job_queue = JobQueue()
@@ -0,0 +1,204 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Histogram buckets (seconds): sub-ms cache hits up to slow page fetches ---
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """Prometheus-style histogram; one bucket array per label combination."""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(s[0]), s[1], s[2]) for key, s in sorted(self._series.items())]
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in snapshot)
+        return lines
+
+
+class CallbackMetric:
+    """A counter or gauge read at scrape time: `collect()` returns {label values tuple: value}."""
+
+    def __init__(self, name, help_text, kind, labelnames, collect):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+                     for key, value in sorted(self.collect().items()))
+        return lines
+
+
+class MetricsRegistry:
+    """Holds the process's metrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets)
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def callback(self, name, help_text, kind, labelnames, collect):
+        """Exports figures kept elsewhere (e.g. a cache's own hit counters) as a 'counter' or 'gauge'."""
+        return self._get_or_create(CallbackMetric, name, help_text, kind, labelnames, collect)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "coin_stage_seconds", "Time spent in instrumented hot-path stages.", ["stage"])
+REQUEST_SECONDS = registry.histogram(
+    "coin_http_request_seconds", "HTTP request latency by endpoint.", ["endpoint", "method", "status"])
+STAGE_ERRORS = registry.counter(
+    "coin_stage_errors_total", "Instrumented stages that raised.", ["stage"])
+
+
+# --- Per-request timing breakdown ---
+class Breakdown:
+    """Milliseconds per stage for one request. Stages run in parallel (page fetches) add up across threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            ms, count = self._stages.get(stage, (0.0, 0))
+            self._stages[stage] = (ms + seconds * 1000, count + 1)
+
+    def as_dict(self):
+        with self._lock:
+            return {stage: {"ms": round(ms, 2), "count": count} for stage, (ms, count) in self._stages.items()}
+
+
+_breakdown = contextvars.ContextVar("timing_breakdown", default=None)
+
+
+def start_breakdown():
+    """Starts collecting a breakdown for the current request; returns (breakdown, token for end_breakdown)."""
+    breakdown = Breakdown()
+    return breakdown, _breakdown.set(breakdown)
+
+
+def end_breakdown(token):
+    _breakdown.reset(token)
+
+
+def in_context(fn):
+    """
+    Wraps `fn` to run with the caller's breakdown active, so spans inside work
+    handed to a thread pool still land in the submitting request's breakdown.
+    """
+    breakdown = _breakdown.get()
+
+    def run(*args, **kwargs):
+        token = _breakdown.set(breakdown)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _breakdown.reset(token)
+    return run
+
+
+def record(stage, seconds):
+    """Adds an already-measured duration, e.g. work interleaved with other stages, as one span would."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown.add(stage, seconds)
+
+
+@contextmanager
+def span(stage):
+    """Times a block into coin_stage_seconds{stage=...} (and the request's breakdown, if one is active)."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        record(stage, time.perf_counter() - start)
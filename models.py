@@ -22,8 +22,10 @@ TABLE_CONFIG = {
 # This defines the common structure for all your key tables.
 class DynastyKeyMixin:
     id = db.Column(db.Integer, primary_key=True)
+    # Not indexed: they are matched with LIKE '%term%', which a B-tree index can't serve
     dynasty = db.Column(db.String(255))
     king_name = db.Column(db.String(255))
+    # The unique constraint doubles as the index used by the coin-code prefix lookups
     code = db.Column(db.String(10), unique=True)
 
 
@@ -31,6 +33,7 @@ class DynastyKeyMixin:
 class CoinDataMixin:
     # Mapped to the uppercase column names in your MySQL database.
     s_no = db.Column('SNO', db.Integer, primary_key=True)
+    # Unique (and therefore indexed): search fetches coins with CODE LIKE 'prefix%'
     code = db.Column('CODE', db.String(10), unique=True)
     details = db.Column('DETAILS', db.Text)
 
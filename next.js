@@ -26,8 +26,9 @@ document.addEventListener("DOMContentLoaded", () => {
         clearResultsAndShowLoading('Searching our database and the web...', textResultsContainer);
 
         try {
-            const response = await fetch(`/api/search?query=${encodeURIComponent(query)}`);
-            await handleApiResponse(response);
+            // stream=1: database hits arrive first, web results are rendered as each one is verified
+            const response = await fetch(`/api/search?query=${encodeURIComponent(query)}&stream=1`);
+            await handleSearchStream(response);
         } catch (error) {
             handleFetchError(error);
         } finally {
@@ -90,6 +91,70 @@ document.addEventListener("DOMContentLoaded", () => {
         // These will now only be called if there's data for them
         displayDatabaseResults(data.database_results || []);
         displayWebResults(data.web_results || []);
+
+        // The web search runs as a background job; render its results once it finishes
+        if (data.web_job_id) {
+            await followWebJob(data.web_job_id);
+        }
+    };
+
+    // Subscribes to a background job's server-sent events and displays its web results
+    const followWebJob = (jobId) => new Promise((resolve) => {
+        loadingMessage.textContent = 'Searching the web...';
+        loadingMessage.style.display = 'block';
+        const events = new EventSource(`/api/jobs/${encodeURIComponent(jobId)}/events`);
+        events.addEventListener('result', (event) => {
+            const job = JSON.parse(event.data);
+            if (job.status === 'done') {
+                displayWebResults(job.result || []);
+            } else {
+                console.error('Web search failed:', job.error);
+            }
+            events.close();
+            resolve();
+        });
+        // Fires for the server's own 'error' events (expired / timed out) and for a dropped connection
+        events.addEventListener('error', (event) => {
+            console.error('Web search job stream ended:', event.data || 'connection lost');
+            events.close();
+            resolve();
+        });
+    });
+
+    const handleSearchStream = async (response) => {
+        if (!response.ok) {
+            const errorData = await response.json();
+            throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+        }
+        // It's a text search, so the AI-specific container stays hidden
+        imageIdResultsContainer.style.display = 'none';
+
+        await readNdjson(response, (message) => {
+            if (message.type === 'database_results') {
+                displayDatabaseResults(message.results || []);
+                loadingMessage.textContent = 'Searching the web...';
+            } else if (message.type === 'web_result') {
+                appendWebResult(message.result);
+            } else if (message.type === 'error') {
+                console.error('Web search error:', message.error);
+            }
+        });
+    };
+
+    // Calls onMessage for every JSON line of a streamed (NDJSON) response as it arrives
+    const readNdjson = async (response, onMessage) => {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.filter(line => line.trim()).forEach(line => onMessage(JSON.parse(line)));
+        }
+        if (buffer.trim()) onMessage(JSON.parse(buffer));
     };
 
     const handleFetchError = (error) => {
@@ -148,22 +213,24 @@ document.addEventListener("DOMContentLoaded", () => {
     const displayWebResults = (results) => {
         if (results.length > 0) {
             webResultsContainer.innerHTML = ''; // Clear previous
-            results.forEach(item => {
-                const card = document.createElement('div');
-                card.className = 'result-card web-result';
-                const summary = item.full_text && item.full_text.length > 10 ?
-                                item.full_text.substring(0, 300) + '...' :
-                                item.snippet;
-                card.innerHTML = `
-                    <h3>${item.title} <span class="engine-tag">${item.engine}</span></h3>
-                    <p>${summary}</p>
-                    <a href="${item.link}" target="_blank" class="read-more">Read more on their site</a>`;
-                webResultsContainer.appendChild(card);
-            });
-            textResultsContainer.style.display = 'block';
-            webResultsSection.style.display = 'block';
+            results.forEach(appendWebResult);
         }
     };
+
+    const appendWebResult = (item) => {
+        const card = document.createElement('div');
+        card.className = 'result-card web-result';
+        const summary = item.full_text && item.full_text.length > 10 ?
+                        item.full_text.substring(0, 300) + '...' :
+                        item.snippet;
+        card.innerHTML = `
+            <h3>${item.title} <span class="engine-tag">${item.engine}</span></h3>
+            <p>${summary}</p>
+            <a href="${item.link}" target="_blank" class="read-more">Read more on their site</a>`;
+        webResultsContainer.appendChild(card);
+        textResultsContainer.style.display = 'block';
+        webResultsSection.style.display = 'block';
+    };
 });
 
 function showPreview(event) {
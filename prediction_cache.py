@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    Caches predict() results keyed by a hash of the uploaded bytes and the
+    model version, so re-uploads and frontend retries skip decode and the
+    forward pass entirely.
+
+    `model_version` identifies the weights the owning Predictor actually
+    loaded (see Predictor._load_versioned), not whatever file is on disk now:
+    a checkpoint replaced under a running process must not get that process's
+    old predictions filed under its version. A reloaded model gets a new cache.
+    The optional disk tier is a SQLite file, so results survive restarts; rows
+    from other versions are purged when a process first opens it.
+    """
+
+    def __init__(self, model_version, max_entries=1024, disk_path=None):
+        self.version = model_version
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (result, compute seconds)
+        self._db = None
+        self._db_pid = None
+        self._disk_writes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    # --- Public API ---
+    def key(self, image_bytes, variant=""):
+        """Cache key for an upload; `variant` separates results computed with different options."""
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return f"{digest}:{variant}" if variant else digest
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                entry = self._disk_get(self.version, key)
+                if entry is not None:
+                    self._remember(key, entry)
+            else:
+                self._memory.move_to_end(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += entry[1]
+            # Callers may annotate the result dict, so hand out a copy
+            return dict(entry[0])
+
+    def put(self, key, result, compute_seconds):
+        """Stores a successful prediction along with how long it took to compute."""
+        if "error" in result:
+            return
+        with self._lock:
+            entry = (dict(result), compute_seconds)
+            self._remember(key, entry)
+            self._disk_put(self.version, key, entry)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_ms": round(self.saved_seconds * 1000, 1),
+                "model_version": self.version,
+            }
+
+    # --- Internals ---
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _connection(self):
+        # One handle per process: SQLite connections must not cross fork()
+        if self.disk_path is None:
+            return None
+        if self._db is None or self._db_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.disk_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.disk_path, check_same_thread=False, isolation_level=None)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                " model_version TEXT NOT NULL, key TEXT NOT NULL, result TEXT NOT NULL,"
+                " compute_seconds REAL NOT NULL, created_at REAL NOT NULL,"
+                " PRIMARY KEY (model_version, key))"
+            )
+            self._db_pid = os.getpid()
+            self._db.execute("DELETE FROM predictions WHERE model_version IS NOT ?", (self.version,))
+        return self._db
+
+    def _disk_get(self, version, key):
+        db = self._connection()
+        if db is None or version is None:
+            return None
+        row = db.execute("SELECT result, compute_seconds FROM predictions WHERE model_version = ? AND key = ?",
+                         (version, key)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def _disk_put(self, version, key, entry):
+        db = self._connection()
+        if db is None or version is None:
+            return
+        db.execute("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)",
+                   (version, key, json.dumps(entry[0]), entry[1], time.time()))
+        # Keep the disk tier bounded too: every so often drop the oldest rows beyond 10x the memory size
+        self._disk_writes += 1
+        if self._disk_writes % 64:
+            return
+        db.execute("DELETE FROM predictions WHERE model_version = ? AND rowid IN ("
+                   " SELECT rowid FROM predictions WHERE model_version = ? ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                   (version, version, self.max_entries * 10))
@@ -1,23 +1,107 @@
 import torch
-import torchvision.transforms as transforms
-from PIL import Image
-from io import BytesIO
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import contextlib
+import json
 import os
+import queue
+import threading
+import time
 
 # Import the classes from your coin_classifier file
-from .coin_classifier import Config, ProtoPNet
+from .coin_classifier import Config, ProtoPNet, FEATURE_GRID
+from .preprocessing import ImagePreprocessor
+from .prediction_cache import PredictionCache
+
+
+def load_checkpoint(path):
+    """
+    Loads a state dict memory-mapped from disk when torch supports it, so the
+    file isn't read into private memory up front. Falls back to a regular load
+    for older torch versions or legacy (non-zip) checkpoints.
+    """
+    try:
+        return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except TypeError:
+        pass
+    except RuntimeError as e:
+        print(f"[AI Predictor] Memory-mapped load unavailable ({e}); reading checkpoint into memory.")
+    # map_location is crucial when loading models on a CPU machine
+    return torch.load(path, map_location="cpu")
+
+
+def file_version(path):
+    """mtime and size of a model artifact, or None if it is missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+def load_versioned(path, load, attempts=3):
+    """
+    Runs `load()` (which reads `path`) and returns (loaded object, version of
+    the file it read). The version is checked before and after, so a file
+    replaced mid-load is loaded again instead of being labelled with the
+    wrong version.
+    """
+    for _ in range(attempts):
+        version = file_version(path)
+        loaded = load()
+        if file_version(path) == version:
+            return loaded, version
+    raise RuntimeError(f"{path} kept changing while it was being loaded")
+
+
+def prediction_variant(top_k, explain):
+    """Cache-key suffix for the optional outputs; empty for the default prediction."""
+    if not top_k and not explain:
+        return ""
+    return f"top{int(top_k or 0)}-explain{int(bool(explain))}"
+
+
+class OnnxModel:
+    """
+    Runs an exported ProtoPNet ONNX graph with onnxruntime behind the same
+    call signature as the eager model: model(batch) -> (logits, distances).
+    """
+
+    def __init__(self, path):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("The 'onnx' inference backend needs the onnxruntime package installed.")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        logits, distances = self.session.run(None, {self.input_name: batch.numpy()})
+        return torch.from_numpy(logits), torch.from_numpy(distances)
+
+    def eval(self):
+        return self
+
+
+def _no_timer(stage):
+    return contextlib.nullcontext()
 
 
 class Predictor:
-    def __init__(self):
+    def __init__(self, backend=None):
         """
         Initializes the predictor with the new ProtoPNet model.
+        `backend` overrides Config.inference_backend ("eager", "torchscript" or "onnx").
         """
         self.config = Config()
+        # Hook for hot-path instrumentation: stage_timer("predict.forward") must return a context manager.
+        # The web app plugs in its metrics span(); standalone use costs nothing.
+        self.stage_timer = _no_timer
         # Force CPU for web server inference to ensure stability
         self.config.device = "cpu"
-
-        print(f"[AI Predictor] Loading ProtoPNet (DenseNet) model from: {self.config.save_path}")
+        self.backend = backend or self.config.inference_backend
 
         # 1. Load classes to determine num_classes (needed for model init)
         self.classes, self.idx_to_class = self._load_classes()
@@ -27,30 +111,99 @@ class Predictor:
             print("[AI Predictor] Warning: No classes found. Using default 39 to avoid crash.")
             num_classes = 39
 
-            # 2. Initialize the model structure with correct num_classes
-        self.model = ProtoPNet(self.config, num_classes).to(self.config.device)
-
-        # 3. Load the trained weights
-        if os.path.exists(self.config.save_path):
-            try:
-                # map_location is crucial when loading models on a CPU machine
-                state_dict = torch.load(self.config.save_path, map_location=self.config.device)
-                self.model.load_state_dict(state_dict)
-                print("[AI Predictor] Model weights loaded successfully.")
-            except Exception as e:
-                raise RuntimeError(f"FATAL: Error loading model weights: {e}")
+        if self.backend == "eager":
+            self._load_eager_model(num_classes)
+        elif self.backend in ("torchscript", "onnx"):
+            self._load_exported_model()
         else:
-            raise RuntimeError(f"FATAL: Model file not found at {self.config.save_path}")
+            raise RuntimeError(f"FATAL: Unknown inference backend '{self.backend}'")
 
         self.model.eval()
-        print(f"[AI Predictor] Initialized successfully with {num_classes} classes.")
+        self.preprocessor = ImagePreprocessor(self.config)
+        self.prototype_sources = self._load_prototype_sources()
+
+        # Results are keyed by upload hash + the version of the weights loaded above, so they expire with them
+        self.cache = None
+        if self.config.prediction_cache_size:
+            self.cache = PredictionCache(self.model_version, max_entries=self.config.prediction_cache_size,
+                                         disk_path=self.config.prediction_cache_path)
+        print(f"[AI Predictor] Initialized successfully with {num_classes} classes ({self.backend} backend).")
+
+    def _load_exported_model(self):
+        """Loads an optimized artifact written by export_model.py."""
+        path = self.config.torchscript_path if self.backend == "torchscript" else self.config.onnx_path
+        self.model_path = path
+        print(f"[AI Predictor] Loading exported {self.backend} model from: {path}")
+        if not os.path.exists(path):
+            raise RuntimeError(f"FATAL: Exported model file not found at {path}")
+        try:
+            if self.backend == "torchscript":
+                load = lambda: torch.jit.load(path, map_location=self.config.device)  # noqa: E731
+            else:
+                load = lambda: OnnxModel(path)  # noqa: E731
+            self.model, self.model_version = load_versioned(path, load)
+        except RuntimeError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"FATAL: Error loading exported model: {e}")
+
+    def _load_eager_model(self, num_classes):
+        print(f"[AI Predictor] Loading ProtoPNet (DenseNet) model from: {self.config.save_path}")
+        self.model_path = self.config.save_path
+        if not os.path.exists(self.config.save_path):
+            raise RuntimeError(f"FATAL: Model file not found at {self.config.save_path}")
+
+        try:
+            state_dict, self.model_version = load_versioned(self.config.save_path,
+                                                            lambda: load_checkpoint(self.config.save_path))
+            try:
+                # 2. Build the structure on the meta device (no weight allocation or random init)
+                #    and adopt the checkpoint tensors directly, so the weights stay backed by the
+                #    memory-mapped file and are shared between forked workers via the page cache.
+                with torch.device("meta"):
+                    model = ProtoPNet(self.config, num_classes, pretrained_backbone=False)
+                model.load_state_dict(state_dict, assign=True)
+            except (AttributeError, TypeError, NotImplementedError):
+                # Older torch without meta-device construction / assign=True
+                model = ProtoPNet(self.config, num_classes, pretrained_backbone=False)
+                model.load_state_dict(state_dict)
+            self.model = model.to(self.config.device)
+            print("[AI Predictor] Model weights loaded successfully.")
+        except Exception as e:
+            raise RuntimeError(f"FATAL: Error loading model weights: {e}")
+
+    def _load_prototype_sources(self):
+        """
+        Provenance written by push.py: prototype index -> training patch it was projected onto.
+        Ignored when the checkpoint is newer (retrained after the last push).
+        """
+        path = self.config.prototype_provenance_path
+        try:
+            if os.path.getmtime(path) < os.path.getmtime(self.config.save_path):
+                print("[AI Predictor] Prototype provenance is older than the model; not attaching sources.")
+                return {}
+            with open(path) as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {r["prototype"]: {"class": r["class"], "source": r.get("source"), "sample": r["sample"],
+                                 "patch": r.get("patch")}
+                for r in records if r.get("sample") is not None}
+
+    def warm_up(self):
+        """Runs one dummy forward pass so the first real request doesn't pay for lazy initialisation."""
+        size = self.config.image_size
+        self.predict_tensors(torch.zeros(1, self.config.input_channels, size, size))
 
     def _load_classes(self):
         """
-        Loads class names from the training directory structure.
+        Loads class names from the training directory structure (the raw
+        image folder when the model was trained from images, see train.split_dirs).
         """
         try:
             train_dir = self.config.train_dir
+            if not os.path.exists(train_dir):
+                train_dir = os.path.join(self.config.image_dir, "train")
             if os.path.exists(train_dir):
                 classes = sorted([d for d in os.listdir(train_dir) if os.path.isdir(os.path.join(train_dir, d))])
                 idx_to_class = {i: c for i, c in enumerate(classes)}
@@ -63,48 +216,293 @@ class Predictor:
             print(f"[AI Predictor] Error loading classes: {e}")
             return [], {}
 
-    def predict(self, image_bytes: bytes):
+    def preprocess(self, image_bytes: bytes):
         """
-        Takes image bytes, preprocesses (including 4th channel), and returns prediction.
+        Decodes image bytes into a single [C, H, W] input tensor (including 4th channel).
         """
-        transform = transforms.Compose([
-            transforms.Resize((self.config.image_size, self.config.image_size)),
-            transforms.ToTensor(),
-        ])
+        with self.stage_timer("predict.preprocess"):
+            return self.preprocessor.preprocess(image_bytes)
 
-        try:
-            img = Image.open(BytesIO(image_bytes)).convert("RGB")
+    def predict_tensors(self, batch, top_k=None, explain=False, row_options=None):
+        """
+        Runs one forward pass over a stacked [B, C, H, W] batch (or a list of [C, H, W]
+        tensors) and returns one result per row.
 
-            # 1. Standard transformation (Resize + ToTensor) -> [3, H, W]
-            x = transform(img).unsqueeze(0)  # [1, 3, H, W]
+        top_k adds the k most likely classes; explain adds, for each of those classes
+        (or just the predicted one), its nearest prototypes with their distances and
+        the feature-map patch they matched. Both come out of the same forward pass.
+        row_options optionally gives a (top_k, explain) pair per row instead.
+        """
+        if isinstance(batch, (list, tuple)):
+            batch = torch.stack(batch)
+        batch = batch.to(self.config.device)
+        if row_options is None:
+            row_options = [(top_k, explain)] * len(batch)
 
-            # 2. Add 4th channel if config requires it (DenseNetBackbone uses 4)
-            if self.config.input_channels == 4:
-                extra_channel = torch.ones(
-                    1, 1,
-                    self.config.image_size, self.config.image_size
-                )
-                x = torch.cat([x, extra_channel], dim=1)  # [1, 4, H, W]
+        # Exported graphs only return (logits, distances), so patch locations are eager-only
+        want_locations = self.backend == "eager" and any(e for _, e in row_options)
 
-            x = x.to(self.config.device)
+        with self.stage_timer("predict.forward"), torch.no_grad():
+            if want_locations:
+                logits, distances, locations = self.model(batch, return_locations=True)
+            else:
+                logits, distances = self.model(batch)
+                locations = None
+            probs = torch.softmax(logits, dim=1)
 
-            with torch.no_grad():
-                logits, _ = self.model(x)
-                probs = torch.softmax(logits, dim=1)
+        with self.stage_timer("predict.postprocess"):
+            return self._build_results(probs, distances, locations, row_options)
 
-            pred_idx = probs.argmax().item()
-            confidence = probs[0][pred_idx].item()
+    def _build_results(self, probs, distances, locations, row_options):
+        confidences, pred_indices = probs.max(dim=1)
 
-            if self.idx_to_class:
-                label = self.idx_to_class.get(pred_idx, f"Class {pred_idx}")
-            else:
-                label = f"Class {pred_idx}"
+        results = []
+        for row, (pred_idx, confidence) in enumerate(zip(pred_indices.tolist(), confidences.tolist())):
+            k, want_explanation = row_options[row]
+            # Validated per row: rows batched together come from different requests
+            try:
+                k = int(k or 0)
+            except (TypeError, ValueError):
+                k = -1
+            if k < 0:
+                results.append({"error": "top_k must be a positive integer."})
+                continue
 
-            return {
-                "predicted_class": label,
+            result = {
+                "predicted_class": self._label(pred_idx),
                 "probability": f"{confidence:.4f}"
             }
+            explained = [pred_idx]
+            if k:
+                top_probs, top_indices = probs[row].topk(min(k, probs.shape[1]))
+                explained = top_indices.tolist()
+                result["top_k"] = [
+                    {"class": self._label(idx), "probability": f"{p:.4f}"}
+                    for idx, p in zip(explained, top_probs.tolist())
+                ]
+            if want_explanation:
+                result["explanation"] = [
+                    self._explain_class(idx, distances[row], None if locations is None else locations[row])
+                    for idx in explained
+                ]
+            results.append(result)
+        return results
+
+    def _label(self, idx):
+        if self.idx_to_class:
+            return self.idx_to_class.get(idx, f"Class {idx}")
+        return f"Class {idx}"
+
+    def _explain_class(self, class_idx, distances, locations):
+        """Nearest prototypes of one class for one image, with the patch each one matched."""
+        per_class = self.config.num_prototypes_per_class
+        first = class_idx * per_class
+        class_distances = distances[first:first + per_class]
+        count = min(self.config.explain_prototypes, len(class_distances))
+        nearest_distances, nearest = class_distances.topk(count, largest=False)
+
+        grid_h, grid_w = FEATURE_GRID
+        cell_h = self.config.image_size / grid_h
+        cell_w = self.config.image_size / grid_w
+
+        prototypes = []
+        for offset, distance in zip(nearest.tolist(), nearest_distances.tolist()):
+            prototype = {"prototype": first + offset, "distance": round(distance, 4)}
+            if first + offset in self.prototype_sources:
+                # Where this prototype came from in the training set (see push.py)
+                prototype["source"] = self.prototype_sources[first + offset]
+            if locations is not None:
+                patch_row, patch_col = divmod(int(locations[first + offset]), grid_w)
+                prototype["patch"] = {
+                    "row": patch_row,
+                    "col": patch_col,
+                    # Patch bounds in the resized model input, as [x0, y0, x1, y1]
+                    "box": [round(patch_col * cell_w), round(patch_row * cell_h),
+                            round((patch_col + 1) * cell_w), round((patch_row + 1) * cell_h)],
+                }
+            prototypes.append(prototype)
+        return {"class": self._label(class_idx), "prototypes": prototypes}
+
+    def predict_batch(self, images, top_k=None, explain=False):
+        """
+        Predicts a list of image bytes with a single forward pass.
+        Images that fail to decode get an {"error": ...} entry in their slot.
+        """
+        results = [None] * len(images)
+        with self.stage_timer("predict.preprocess"):
+            batch, errors = self.preprocessor.preprocess_batch(images)
+        for i, e in errors.items():
+            print(f"Prediction Error: {e}")
+            results[i] = {"error": str(e)}
+        positions = [i for i in range(len(images)) if i not in errors]
+
+        if positions:
+            try:
+                for i, result in zip(positions, self.predict_tensors(batch, top_k=top_k, explain=explain)):
+                    results[i] = result
+            except Exception as e:
+                print(f"Prediction Error: {e}")
+                for i in positions:
+                    results[i] = {"error": str(e)}
+
+        return results
+
+    def predict(self, image_bytes: bytes, top_k=None, explain=False):
+        """
+        Takes image bytes, preprocesses (including 4th channel), and returns prediction.
+        Optionally adds the top_k classes and prototype explanations (see predict_tensors).
+        """
+        return self.cached_predict(
+            image_bytes,
+            lambda: self.predict_batch([image_bytes], top_k=top_k, explain=explain)[0],
+            variant=prediction_variant(top_k, explain)
+        )
+
+    def cached_predict(self, image_bytes, compute, variant=""):
+        """Returns the cached result for these bytes, or runs `compute()` and caches what it returns."""
+        if self.cache is None:
+            return compute()
+
+        with self.stage_timer("predict.cache_lookup"):
+            key = self.cache.key(image_bytes, variant)
+            result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        start = time.perf_counter()
+        result = compute()
+        self.cache.put(key, result, time.perf_counter() - start)
+        return result
+
+
+class BatchingPredictor:
+    """
+    Dynamic micro-batching front-end for a Predictor.
+
+    Concurrent predict() calls decode their image on the calling thread, then
+    hand the tensor to a single worker thread that gathers up to
+    `max_batch_size` inputs (or waits at most `max_wait_ms` after the first
+    one arrives) and runs one ProtoPNet forward pass on the stacked batch.
+    Each caller blocks on its own Future and receives only its own result.
+    A caller that times out cancels its Future, so the worker skips it if the
+    batch has not started yet. After close(), predict() raises RuntimeError.
+    """
 
+    def __init__(self, predictor, max_batch_size=None, max_wait_ms=None):
+        self.predictor = predictor
+        self.config = predictor.config
+        self.max_batch_size = max_batch_size or self.config.max_batch_size
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else self.config.max_batch_wait_ms) / 1000.0
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._close_lock = threading.Lock()  # Orders submissions against the shutdown signal
+        # Hook for admission control: admit() must return a context manager, held while a cache miss
+        # is decoded and waits for its batch. The web app plugs in its inference limiter.
+        self.admit = contextlib.nullcontext
+        self._worker = threading.Thread(target=self._run, name="predictor-batcher", daemon=True)
+        self._worker.start()
+
+    def __getattr__(self, name):
+        # Expose the wrapped predictor's attributes (classes, model, config, ...). Only reached for
+        # missing attributes, so guard `predictor` itself (e.g. during unpickling) against recursion.
+        if name == "predictor" or "predictor" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.predictor, name)
+
+    def predict(self, image_bytes: bytes, top_k=None, explain=False, timeout=None):
+        """
+        Same contract as Predictor.predict, but the forward pass is shared with other callers.
+        """
+        if self._closed:
+            raise RuntimeError("BatchingPredictor is closed")
+        return self.predictor.cached_predict(
+            image_bytes,
+            lambda: self._predict_batched(image_bytes, (top_k, explain), timeout),
+            variant=prediction_variant(top_k, explain)
+        )
+
+    def _predict_batched(self, image_bytes, options, timeout):
+        # Only cache misses get here, so cache hits never take an admission slot
+        with self.admit():
+            return self._decode_and_wait(image_bytes, options, timeout)
+
+    def _decode_and_wait(self, image_bytes, options, timeout):
+        try:
+            x = self.predictor.preprocess(image_bytes)
+        except Exception as e:
+            print(f"Prediction Error: {e}")
+            return {"error": str(e)}
+
+        future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("BatchingPredictor is closed")
+            self._queue.put((x, options, future))
+        try:
+            # Queueing for the batcher plus the shared forward pass, as seen by this caller
+            with self.predictor.stage_timer("predict.batch_wait"):
+                return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Nobody will read the result any more; the worker drops it unless it is already running
+            future.cancel()
+            print(f"Prediction Error: timed out after {timeout}s")
+            return {"error": "Prediction timed out"}
         except Exception as e:
             print(f"Prediction Error: {e}")
-            return {"error": str(e)}
\ No newline at end of file
+            return {"error": str(e)}
+
+    def close(self):
+        """Stops the worker thread once queued requests have been served. Safe to call twice."""
+        with self._close_lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._worker.join()
+
+    def _collect_batch(self):
+        """Blocks for the first request, then gathers more until the batch is full or the wait expires."""
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Serve what we have, then let the outer loop see the shutdown signal
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+
+            # Drop requests whose caller gave up while queued; the rest can no longer be cancelled
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            tensors = [x for x, _, _ in batch]
+            options = [o for _, o, _ in batch]
+            futures = [f for _, _, f in batch]
+            try:
+                results = self.predictor.predict_tensors(torch.stack(tensors), row_options=options)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for future, result in zip(futures, results):
+                future.set_result(result)
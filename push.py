@@ -0,0 +1,133 @@
+"""
+Prototype projection ("push"): snap every prototype onto its nearest real
+training patch, so each prototype is literally a piece of some coin image.
+
+    python -m ai_model.push [--workers 8] [--batch-size 64]
+
+The training set is streamed once. For each batch, the backbone's patches are
+compared against all prototypes with ProtoPNet.patch_distances (the same
+|x|^2 - 2x.p + |p|^2 matmul the forward pass uses), patches from other classes
+are masked out, and a running per-prototype minimum is kept together with the
+sample and patch it came from. Decoding runs in DataLoader workers and the
+distance matmuls use all of torch's intra-op threads, so no prototype ever
+loops over patches in Python.
+
+The projected weights are written back to Config.save_path and the
+provenance (source sample, patch row/col, distance) to
+Config.prototype_provenance_path, which Predictor uses to show where each
+prototype in an explanation came from.
+"""
+import argparse
+import json
+import os
+
+import torch
+from torch.utils.data import DataLoader
+
+from .coin_classifier import Config, ProtoPNet, FEATURE_GRID
+from .predictor import load_checkpoint
+from .train import open_split, save_atomic, split_dirs
+
+
+# ============================================================
+# PROJECTION
+# ============================================================
+@torch.inference_mode()
+def find_nearest_patches(model, loader, device):
+    """
+    Returns (distances, vectors, sample_indices, patch_indices) for every
+    prototype's nearest same-class training patch. Prototypes whose class has
+    no training samples keep distance inf and sample index -1.
+    """
+    model.eval()
+    P = model.P
+    prototype_class = torch.arange(P, device=device) // model.k
+
+    best_distances = torch.full((P,), float("inf"), device=device)
+    best_vectors = model.prototype_vectors.detach().clone()
+    best_samples = torch.full((P,), -1, dtype=torch.long, device=device)
+    best_patches = torch.full((P,), -1, dtype=torch.long, device=device)
+
+    offset = 0
+    for x, y in loader:
+        x = x.to(device, non_blocking=True)
+        y = y.to(device, non_blocking=True)
+        patches = model.patches(x)  # [B, H*W, C]
+        B, HW, C = patches.shape
+
+        distances = model.patch_distances(patches)  # [B, H*W, P]
+        other_class = prototype_class.unsqueeze(0) != y.unsqueeze(1)  # [B, P]
+        distances = distances.masked_fill(other_class.unsqueeze(1), float("inf"))
+
+        # One reduction over every patch in the batch gives each prototype's batch-best candidate
+        batch_best, rows = distances.reshape(B * HW, P).min(dim=0)
+        better = batch_best < best_distances
+        if better.any():
+            rows = rows[better]
+            best_distances[better] = batch_best[better]
+            best_vectors[better] = patches.reshape(B * HW, C)[rows].to(best_vectors.dtype)
+            best_samples[better] = offset + rows // HW
+            best_patches[better] = rows % HW
+        offset += B
+
+    return best_distances, best_vectors, best_samples, best_patches
+
+
+def push_prototypes(model, dataset, device, batch_size=64, workers=0):
+    """Projects the model's prototypes in place and returns one provenance record per prototype."""
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=workers)
+    distances, vectors, samples, patches = find_nearest_patches(model, loader, device)
+
+    found = samples >= 0
+    with torch.no_grad():
+        model.prototype_vectors[found] = vectors[found]
+
+    grid_w = FEATURE_GRID[1]
+    sources = getattr(dataset, "samples", None)
+    root_dir = getattr(dataset, "root_dir", None)
+    records = []
+    for j, (distance, sample, patch) in enumerate(zip(distances.tolist(), samples.tolist(), patches.tolist())):
+        record = {"prototype": j, "class": dataset.classes[j // model.k], "distance": None, "sample": None}
+        if sample >= 0:
+            row, col = divmod(patch, grid_w)
+            record["distance"] = round(distance, 6)
+            record["sample"] = sample
+            record["patch"] = {"row": row, "col": col}
+            if sources is not None:
+                record["source"] = os.path.relpath(sources[sample][0], root_dir).replace(os.sep, "/")
+        records.append(record)
+
+    missing = int((~found).sum())
+    if missing:
+        print(f"[Push] {missing} prototypes had no same-class training patch and were left unchanged.")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, help="DataLoader worker processes (defaults to Config.num_workers)")
+    args = parser.parse_args()
+
+    cfg = Config()
+    device = torch.device(cfg.device)
+    dataset = open_split(cfg, "train")
+    if len(dataset) == 0:
+        raise RuntimeError(f"No training samples found in {split_dirs(cfg, 'train')[0]}")
+
+    model = ProtoPNet(cfg, len(dataset.classes), pretrained_backbone=False)
+    model.load_state_dict(load_checkpoint(cfg.save_path))
+    model.to(device)
+
+    workers = cfg.num_workers if args.workers is None else args.workers
+    records = push_prototypes(model, dataset, device, batch_size=args.batch_size, workers=workers)
+
+    save_atomic(model.state_dict(), cfg.save_path)
+    with open(cfg.prototype_provenance_path, "w") as f:
+        json.dump(records, f, indent=2)
+    print(f"[Push] Projected {model.P} prototypes; weights saved to {cfg.save_path}, "
+          f"provenance to {cfg.prototype_provenance_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,212 @@
-from flask import Blueprint, render_template, request, jsonify
-from sqlalchemy import or_, inspect
-from . import scraper, db
-from .models import (
-    AncientDynastyKey, AncientCoinData,
-    MedievalDynastyKey, MedievalCoinData,
-    ModernDynastyKey, ModernCoinData
-)
-from .image_finder import find_image_path
+import json
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from flask import Blueprint, Response, g, render_template, request, jsonify
+from . import admission, metrics, scraper, db
+from .search import search_catalogue
+from .jobs import job_queue
 
 # --- AI Model Integration ---
-from ai_model.predictor import Predictor
+from ai_model.predictor import Predictor, BatchingPredictor
+from ai_model.preprocessing import IMAGE_EXTENSIONS
 
+# Built on first use or by warm_up_predictor(), never at import time
 predictor = None
-try:
-    predictor = Predictor()
-except RuntimeError as e:
-    print(f"!!!!!!!!!!\nFATAL AI MODEL ERROR during initial load: {e}\n!!!!!!!!!!")
+predictor_error = None
+_predictor_lock = threading.Lock()
+# Loaded-but-not-run Predictor from preload_predictor(), adopted by get_predictor() in each forked worker
+_preloaded = None
+
+
+def get_predictor():
+    """Returns the shared predictor, loading it on first call. None if the model failed to load."""
+    global predictor, predictor_error
+    if predictor is not None or predictor_error is not None:
+        return predictor
+    with _predictor_lock:
+        if predictor is None and predictor_error is None:
+            try:
+                loaded = _preloaded or Predictor()
+                loaded.warm_up()
+                # Time decode / forward / postprocess into /metrics from here on (warm-up excluded)
+                loaded.stage_timer = metrics.span
+                # Concurrent uploads share batched forward passes instead of running batch-of-one each
+                batching = BatchingPredictor(loaded)
+                # Admit enough uploads to fill the micro-batches; cache hits bypass the gate
+                admission.configure_inference(loaded.config.max_batch_size)
+                batching.admit = lambda: admission.inference_limiter.admit()
+                predictor = batching
+            except RuntimeError as e:
+                predictor_error = str(e)
+                print(f"!!!!!!!!!!\nFATAL AI MODEL ERROR during initial load: {e}\n!!!!!!!!!!")
+    return predictor
+
+
+def preload_predictor():
+    """
+    Pre-fork servers (serve.py): builds the Predictor in the master without running
+    a forward pass, so forked workers share its memory-mapped weights copy-on-write.
+    Each worker then warms it up and starts its own batcher thread in get_predictor().
+    Returns False (keeping any previously preloaded model) if loading fails.
+    """
+    global _preloaded, predictor_error
+    try:
+        loaded = Predictor()
+    except RuntimeError as e:
+        print(f"!!!!!!!!!!\nFATAL AI MODEL ERROR during preload: {e}\n!!!!!!!!!!")
+        if _preloaded is None:
+            predictor_error = str(e)
+        return False
+    with _predictor_lock:
+        _preloaded = loaded
+        predictor_error = None
+    return True
+
+
+def _prediction_cache_stats():
+    cache = predictor.cache if predictor is not None else None
+    return cache.stats() if cache is not None else None
+
+
+def _prediction_cache_metric(collect):
+    def read():
+        stats = _prediction_cache_stats()
+        return collect(stats) if stats else {}
+    return read
+
+
+# The prediction cache's own counters, exported next to the other serving metrics
+metrics.registry.callback(
+    "coin_prediction_cache_lookups_total", "Prediction cache lookups by outcome.", "counter", ["result"],
+    _prediction_cache_metric(lambda s: {('hit',): s['hits'], ('miss',): s['misses']}))
+metrics.registry.callback(
+    "coin_prediction_cache_saved_seconds_total", "Inference time saved by prediction cache hits.", "counter", [],
+    _prediction_cache_metric(lambda s: {(): s['saved_ms'] / 1000}))
+metrics.registry.callback(
+    "coin_prediction_cache_entries", "Predictions held in the in-memory cache.", "gauge", [],
+    _prediction_cache_metric(lambda s: {(): s['entries']}))
+
+
+def warm_up_predictor(background=False):
+    """Start-up hook: loads the model now (or on a daemon thread) instead of on the first upload."""
+    if background:
+        threading.Thread(target=get_predictor, name="predictor-warm-up", daemon=True).start()
+    else:
+        get_predictor()
 
 bp = Blueprint('main', __name__)
 
-MODEL_MAP = {
-    'ancient': {'keys': AncientDynastyKey, 'data': AncientCoinData},
-    'medieval': {'keys': MedievalDynastyKey, 'data': MedievalCoinData},
-    'modern': {'keys': ModernDynastyKey, 'data': ModernCoinData}
-}
+# --- Batch identification settings ---
+MAX_BATCH_IMAGES = 1000
+MAX_BATCH_BYTES = 256 * 1024 * 1024  # Image bytes per batch, archive members counted uncompressed
+
+# Image decoding/resizing releases the GIL, so a thread pool keeps all cores busy
+preprocess_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix='preprocess')
+
+# How long a /events stream waits for a background job before giving up
+JOB_EVENTS_TIMEOUT = 120
+
+
+def _web_search_job(payload):
+    return scraper.multi_search_snippets(query=payload['query'], max_results=payload['max_results'])
 
 
-def table_exists(table_name):
-    inspector = inspect(db.engine)
-    return inspector.has_table(table_name)
+job_queue.register_handler('web_search', _web_search_job)
+
+
+def _submit_web_search(scraper_query, max_results=3):
+    """Queues web enrichment; identical queries already in flight share one job."""
+    return job_queue.submit(
+        'web_search',
+        {'query': scraper_query, 'max_results': max_results},
+        dedupe_key=f"web_search:{max_results}:{scraper_query.lower()}"
+    )
+
+
+def _request_flag(name, form=True, default=False):
+    """
+    True if a query-string (or, with `form`, form) field is set to 1/true/yes;
+    `default` if the field is absent. Reading the form parses the whole request
+    body, so hooks that run before the upload checks must pass form=False.
+    """
+    value = request.args.get(name, '')
+    if not value and form:
+        value = request.form.get(name, '')
+    if not value:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _enrich_or_defer(scraper_query):
+    """
+    Runs the web search inline if an enrichment slot frees up in time;
+    otherwise queues it as a background job so a slow scraper can't hold the
+    response. Returns (web_results, web_job_id).
+    """
+    try:
+        with admission.enrichment_limiter.admit():
+            return scraper.multi_search_snippets(query=scraper_query, max_results=3), None
+    except admission.AdmissionError:
+        print(f"[Web] Enrichment is saturated; deferring '{scraper_query}' to a background job.")
+        return [], _submit_web_search(scraper_query)
+
+
+@bp.errorhandler(admission.AdmissionError)
+def _admission_rejected(e):
+    headers = {'Retry-After': str(e.retry_after)} if e.retry_after else {}
+    return jsonify({"error": e.message}), e.status, headers
+
+
+@bp.errorhandler(413)
+def _request_too_large(e):
+    # Raised by Flask when a body exceeds MAX_CONTENT_LENGTH; answer in JSON like every other API error
+    return jsonify({"error": f"Request is larger than {admission.MAX_REQUEST_BYTES // (1024 * 1024)} MB."}), 413
+
+
+@bp.before_request
+def _start_request_timing():
+    g.request_start = time.perf_counter()
+    # ?timing=1 adds a per-stage breakdown to the JSON response (and a Server-Timing header)
+    if _request_flag('timing', form=False):
+        g.timing, g.timing_token = metrics.start_breakdown()
+
+
+@bp.after_request
+def _finish_request_timing(response):
+    elapsed = time.perf_counter() - g.request_start
+    # Streamed responses (NDJSON, SSE) are measured up to the first byte
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint=request.endpoint or 'unknown', method=request.method,
+                                    status=str(response.status_code))
+
+    breakdown = g.pop('timing', None)
+    if breakdown is not None:
+        stages = breakdown.as_dict()
+        response.headers['Server-Timing'] = ', '.join(
+            [f"total;dur={elapsed * 1000:.2f}"] + [f"{name};dur={s['ms']}" for name, s in stages.items()])
+        if response.is_json and not response.is_streamed:
+            body = response.get_json(silent=True)
+            if isinstance(body, dict):
+                body['timing'] = {'total_ms': round(elapsed * 1000, 2), 'stages': stages}
+                response.set_data(json.dumps(body))
+    return response
+
+
+@bp.teardown_request
+def _end_request_timing(exc):
+    token = g.pop('timing_token', None)
+    if token is not None:
+        metrics.end_breakdown(token)
+
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    """Stage and request latency histograms in the Prometheus text format."""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 
 @bp.route('/')
@@ -42,21 +220,38 @@ def ai_identify():
     Receives an uploaded image, classifies it using the AI, and searches the web.
     Database search is skipped as per request.
     """
-    global predictor
+    predictor = get_predictor()
     if predictor is None:
         print("[AI Identify] Error: Predictor object was not loaded successfully.")
         return jsonify({"error": "AI model is not available. Check server logs."}), 503
 
+    # Cheap refusals first, before the body is parsed or anything is decoded
+    admission.identify_rate_limiter.check(request.remote_addr)
+    admission.check_upload_size(request.content_length)
+
     if 'coin_image' not in request.files:
         return jsonify({"error": "No image file provided."}), 400
 
     image_file = request.files['coin_image']
-    image_bytes = image_file.read()
+    image_bytes = admission.read_limited(image_file)
     if not image_bytes:
         return jsonify({"error": "Image file is empty."}), 400
+    admission.check_image_pixels(image_bytes)
+
+    # Optional extras, computed in the same forward pass: ?top_k=3&explain=1
+    raw_top_k = request.args.get('top_k', request.form.get('top_k', ''))
+    top_k = None
+    if raw_top_k != '':
+        try:
+            top_k = int(raw_top_k)
+        except ValueError:
+            return jsonify({"error": "top_k must be an integer."}), 400
+        if top_k < 1:
+            return jsonify({"error": "top_k must be at least 1."}), 400
 
     print("[AI Identify] Received image. Getting prediction...")
-    ai_prediction = predictor.predict(image_bytes)
+    # Cache misses wait for an inference slot inside predict() (BatchingPredictor.admit)
+    ai_prediction = predictor.predict(image_bytes, top_k=top_k, explain=_request_flag('explain'))
 
     if "error" in ai_prediction:
         return jsonify({"error": ai_prediction['error']}), 400
@@ -68,14 +263,27 @@ def ai_identify():
         # --- WEB SCRAPER LOGIC ---
         # Use the AI's prediction to search the web
         scraper_query = f"{predicted_class} coin numismatics"
+        if _request_flag('async', default=True):
+            # Answer now; the client polls /api/jobs/<id> (or its /events stream) for web results.
+            # async=0 runs the scrape inline instead (still deferred when enrichment is saturated)
+            return jsonify({
+                'ai_prediction': ai_prediction,
+                'database_results': [],
+                'web_results': [],
+                'web_job_id': _submit_web_search(scraper_query)
+            })
+
         print(f"[Web] Running scraper with AI prediction: '{scraper_query}'")
-        web_results = scraper.multi_search_snippets(query=scraper_query, max_results=3)
+        web_results, web_job_id = _enrich_or_defer(scraper_query)
 
-        return jsonify({
+        response = {
             'ai_prediction': ai_prediction,
             'database_results': [],  # Empty list as requested
             'web_results': web_results
-        })
+        }
+        if web_job_id:
+            response['web_job_id'] = web_job_id
+        return jsonify(response)
 
     except Exception as e:
         print(f"[AI Identify] Error: {e}")
@@ -87,6 +295,15 @@ def ai_identify():
         }), 500
 
 
+@bp.route('/api/ai-identify/cache-stats')
+def ai_identify_cache_stats():
+    """Hit rate and time saved by the prediction cache (also on /metrics as coin_prediction_cache_*)."""
+    stats = _prediction_cache_stats() if get_predictor() is not None else None
+    if stats is None:
+        return jsonify({"error": "Prediction cache is not enabled."}), 404
+    return jsonify(stats)
+
+
 @bp.route('/api/search')
 def api_search():
     """The main API endpoint that performs text-based searches across all periods."""
@@ -97,40 +314,249 @@ def api_search():
     print(f"\n[Backend] Received search query: '{query}'")
 
     try:
-        db_results = []
-        search_terms = query.split()
-
-        for period, models in MODEL_MAP.items():
-            KeyModel, DataModel = models['keys'], models['data']
-            if not table_exists(KeyModel.__tablename__) or not table_exists(DataModel.__tablename__):
-                continue
-
-            print(f"[Database] Searching in '{period}' tables...")
-            dynasty_query_filters = [
-                or_(KeyModel.dynasty.like(f'%{term}%'), KeyModel.king_name.like(f'%{term}%'))
-                for term in search_terms
-            ]
-            matched_keys = KeyModel.query.filter(or_(*dynasty_query_filters)).all()
-
-            if matched_keys:
-                for key in matched_keys:
-                    coins = DataModel.query.filter(DataModel.code.startswith(key.code)).all()
-                    for coin in coins:
-                        coin_dict = coin.to_dict_with_key_info(key)
-                        coin_dict['image_url'] = find_image_path(coin_dict)
-                        db_results.append(coin_dict)
-            else:
-                print(f"[Database] No matching keys found in '{period}' tables for this query.")
+        db_results = search_catalogue(query)
 
         scraper_query = f"{query} coin numismatics"
-        web_results = scraper.multi_search_snippets(query=scraper_query, max_results=3)
+        if _request_flag('stream'):
+            return _stream_search_results(db_results, scraper_query)
+        if _request_flag('async', default=True):
+            return jsonify({
+                'database_results': db_results,
+                'web_results': [],
+                'web_job_id': _submit_web_search(scraper_query)
+            })
 
-        return jsonify({
+        web_results, web_job_id = _enrich_or_defer(scraper_query)
+
+        response = {
             'database_results': db_results,
             'web_results': web_results
-        })
+        }
+        if web_job_id:
+            response['web_job_id'] = web_job_id
+        return jsonify(response)
 
     except Exception as e:
         db.session.rollback()
         print(f"[Backend] An error occurred: {e}")
-        return jsonify({"error": "Sorry, something went wrong on our end."}), 500
\ No newline at end of file
+        return jsonify({"error": "Sorry, something went wrong on our end."}), 500
+
+
+def _stream_search_results(db_results, scraper_query):
+    """
+    Streams search results as NDJSON: database hits first, then one line per
+    web result as soon as it is fetched and verified, then a closing 'done' line.
+    """
+    def generate():
+        yield json.dumps({'type': 'database_results', 'results': db_results}) + '\n'
+        count = 0
+        try:
+            for result in scraper.iter_search_results(query=scraper_query, max_results=3):
+                count += 1
+                yield json.dumps({'type': 'web_result', 'result': result}) + '\n'
+        except Exception as e:
+            print(f"[Backend] Web search failed while streaming: {e}")
+            yield json.dumps({'type': 'error', 'error': "An error occurred during web search."}) + '\n'
+        yield json.dumps({'type': 'done', 'web_results': count}) + '\n'
+
+    # Stop proxies (nginx) from buffering the stream into one late response
+    return Response(generate(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+
+def _collect_batch_uploads():
+    """
+    Gathers (filename, bytes) pairs from a multipart list ('coin_images')
+    and/or a zip archive ('archive'). An image over the per-upload size limit
+    gets the AdmissionError that rejected it in place of its bytes.
+
+    Image counts and archive member sizes are checked against MAX_BATCH_IMAGES
+    and MAX_BATCH_BYTES before anything is decompressed, so a zip bomb is
+    refused instead of inflated into memory.
+    """
+    image_files = request.files.getlist('coin_images')
+    if len(image_files) > MAX_BATCH_IMAGES:
+        raise _batch_too_large()
+
+    uploads = []
+    for image_file in image_files:
+        # Oversized images fail their own line, as an undecodable one would, not the whole batch
+        try:
+            uploads.append((image_file.filename, admission.read_limited(image_file)))
+        except admission.AdmissionError as e:
+            uploads.append((image_file.filename, e))
+
+    archive = request.files.get('archive')
+    if archive:
+        total_bytes = sum(len(data) for _, data in uploads if isinstance(data, bytes))
+        with zipfile.ZipFile(BytesIO(archive.read())) as zf:
+            members = [info for info in zf.infolist()
+                       if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+                       and info.filename.lower().endswith(IMAGE_EXTENSIONS)]
+            if len(uploads) + len(members) > MAX_BATCH_IMAGES:
+                raise _batch_too_large()
+
+            for info in members:
+                # file_size comes from the archive's directory; zipfile never inflates a member beyond it
+                if info.file_size > admission.MAX_UPLOAD_BYTES:
+                    uploads.append((info.filename, admission.upload_too_large()))
+                    continue
+                total_bytes += info.file_size
+                if total_bytes > MAX_BATCH_BYTES:
+                    raise admission.AdmissionError(
+                        f"The batch's images add up to more than {MAX_BATCH_BYTES // (1024 * 1024)} MB "
+                        f"uncompressed.", status=413)
+                uploads.append((info.filename, zf.read(info)))
+
+    return uploads
+
+
+def _batch_too_large():
+    return admission.AdmissionError(f"At most {MAX_BATCH_IMAGES} images can be identified per request.",
+                                    status=413)
+
+
+def _safe_preprocess(predictor, image_bytes):
+    """Decodes one upload, returning the exception instead of raising so one bad file can't sink a batch."""
+    if isinstance(image_bytes, Exception):
+        return image_bytes
+    if not image_bytes:
+        return ValueError("Image file is empty.")
+    try:
+        admission.check_image_pixels(image_bytes)
+        return predictor.preprocess(image_bytes)
+    except Exception as e:
+        return e
+
+
+@bp.route('/api/ai-identify/batch', methods=['POST'])
+def ai_identify_batch():
+    """
+    Classifies a collection of coin images (multipart list or zip archive) and
+    streams one NDJSON line per image as each fixed-size batch finishes.
+    Pass enrich=1 to queue a web search per predicted class on the job queue;
+    each line then carries the `web_job_id` to poll for its web results.
+    """
+    predictor = get_predictor()
+    if predictor is None:
+        print("[AI Batch] Error: Predictor object was not loaded successfully.")
+        return jsonify({"error": "AI model is not available. Check server logs."}), 503
+
+    # One token up front, before the body is parsed or any archive inflated, so a throttled
+    # client is turned away cheaply; the rest of the batch is charged per image below
+    admission.identify_rate_limiter.check(request.remote_addr)
+
+    try:
+        uploads = _collect_batch_uploads()
+    except zipfile.BadZipFile:
+        return jsonify({"error": "The uploaded archive is not a valid zip file."}), 400
+
+    if not uploads:
+        return jsonify({"error": "No image files provided."}), 400
+    # Each image costs a token, as it would through /api/ai-identify
+    admission.identify_rate_limiter.check(request.remote_addr, cost=len(uploads), prepaid=1)
+
+    enrich = _request_flag('enrich')
+    batch_size = predictor.config.max_batch_size
+    chunks = [uploads[i:i + batch_size] for i in range(0, len(uploads), batch_size)]
+    print(f"[AI Batch] Received {len(uploads)} images in {len(chunks)} batches (enrich={enrich}).")
+
+    def submit(chunk):
+        return [preprocess_pool.submit(_safe_preprocess, predictor, image_bytes) for _, image_bytes in chunk]
+
+    def generate():
+        web_jobs = {}
+        processed = failed = 0
+        pending = submit(chunks[0])
+
+        for index, chunk in enumerate(chunks):
+            decoded = [f.result() for f in pending]
+            # Decode the next batch while this one runs through the model
+            pending = submit(chunks[index + 1]) if index + 1 < len(chunks) else []
+
+            results = [None] * len(chunk)
+            tensors, positions = [], []
+            for i, item in enumerate(decoded):
+                if isinstance(item, Exception):
+                    results[i] = {"error": str(item)}
+                else:
+                    tensors.append(item)
+                    positions.append(i)
+
+            if tensors:
+                try:
+                    # Share inference slots with single uploads; the stream has started, so wait rather than shed
+                    with admission.inference_limiter.admit(max_wait=None):
+                        batch_results = predictor.predict_tensors(tensors)
+                    for i, result in zip(positions, batch_results):
+                        results[i] = result
+                except Exception as e:
+                    print(f"[AI Batch] Error: {e}")
+                    for i in positions:
+                        results[i] = {"error": str(e)}
+
+            for (filename, _), result in zip(chunk, results):
+                line = {'filename': filename}
+                if "error" in result:
+                    failed += 1
+                    line['error'] = result['error']
+                else:
+                    line['ai_prediction'] = result
+                    if enrich:
+                        # Never scrape on the streaming worker: one background job per class,
+                        # shared with identical searches already in flight
+                        predicted_class = result['predicted_class']
+                        if predicted_class not in web_jobs:
+                            web_jobs[predicted_class] = _submit_web_search(f"{predicted_class} coin numismatics")
+                        line['web_job_id'] = web_jobs[predicted_class]
+                processed += 1
+                yield json.dumps(line) + '\n'
+
+        yield json.dumps({'done': True, 'processed': processed, 'failed': failed}) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@bp.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Polling endpoint for background jobs (e.g. the web_job_id from an async search)."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id."}), 404
+    return jsonify(job)
+
+
+@bp.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-sent events for a background job: status updates, then the finished job."""
+    if job_queue.get(job_id) is None:
+        return jsonify({"error": "Unknown job id."}), 404
+
+    def generate():
+        deadline = time.monotonic() + JOB_EVENTS_TIMEOUT
+        last_status = None
+        while True:
+            job = job_queue.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Job expired.'})}\n\n"
+                return
+            if job['status'] in ('done', 'failed'):
+                yield f"event: result\ndata: {json.dumps(job)}\n\n"
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield f"event: status\ndata: {json.dumps({'status': last_status})}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            if time.monotonic() > deadline:
+                yield f"event: error\ndata: {json.dumps({'error': 'Timed out waiting for job.'})}\n\n"
+                return
+            time.sleep(0.5)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@bp.route('/api/jobs/metrics')
+def job_metrics():
+    """Queue depth, worker count and wait/run latency of the background job queue."""
+    return jsonify(job_queue.metrics())
@@ -1,144 +1,570 @@
 import requests
-from bs4 import BeautifulSoup, Comment
 from ddgs import DDGS
 from googlesearch import search as google_search
-from .utils import load_random_headers, clean_text
-from time import sleep
-import random
+from .utils import http_get, clean_text
+from .cache import TTLCache
+from .metrics import registry, span, in_context, record
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import Counter
+from functools import lru_cache
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+import codecs
+import math
+import re
+import threading
+import time
 
-# Keywords to verify if a page is actually about coins
-COIN_KEYWORDS = [
-    'numismatic', 'coin', 'mint', 'obverse', 'reverse', 'dynasty',
-    'ruler', 'bullion', 'drachm', 'tetradrachm', 'aureus', 'denarius',
-    'ancient', 'currency', 'collection', 'emperor', 'king'
-]
+# Keywords to verify if a page is actually about coins, weighted by how specific
+# they are to numismatics. Matched as word prefixes: 'coin' also counts 'coins' and 'coinage'.
+COIN_KEYWORD_WEIGHTS = {
+    'numismatic': 3.0, 'obverse': 3.0, 'drachm': 3.0, 'tetradrachm': 3.0, 'aureus': 3.0, 'denarius': 3.0,
+    'coin': 2.0, 'dynasty': 1.5, 'mint': 1.0, 'reverse': 1.0, 'ruler': 1.0, 'bullion': 1.0,
+    'ancient': 1.0, 'currency': 1.0, 'emperor': 1.0, 'king': 1.0, 'collection': 0.5,
+}
+COIN_KEYWORDS = list(COIN_KEYWORD_WEIGHTS)
 
+# --- Relevance ranking ---
+RELEVANCE_THRESHOLD = 3     # Distinct coin keywords a page needs to be considered relevant at all
+QUERY_TERM_WEIGHT = 4.0     # Words of the query itself, e.g. the predicted dynasty or ruler
+QUERY_STOPWORDS = {'and', 'the', 'of', 'de', 'von', 'van', 'ibn', 'bin'}
+STRONG_MATCH_SCORE = 25.0   # multi_search_snippets stops fetching once max_results pages score this high
+CANDIDATES_PER_ENGINE = 2   # multi_search_snippets asks each engine for max_results x this many pages
+RANKING_GRACE = 1.5         # Seconds multi_search_snippets keeps fetching, once it has max_results relevant
+                            # pages, in case a better one is still in flight
 
-def fetch_full_text(url, delay=1):
+# --- Concurrency settings ---
+SEARCH_DEADLINE = 12      # Seconds allowed for one multi_search_snippets call, end to end
+FETCH_WORKERS = 8         # Pages fetched in parallel across all hosts
+PER_HOST_LIMIT = 2        # Simultaneous connections to a single host
+PER_HOST_DELAY = 1        # Seconds between successive requests to the same host
+
+# --- Page extraction limits ---
+MAX_PAGE_BYTES = 2 * 1024 * 1024   # Stop downloading a page after this many (decompressed) bytes
+MAX_TEXT_CHARS = 50_000            # Extracted text kept per page
+STREAM_CHUNK_BYTES = 64 * 1024     # Bytes parsed at a time while the page downloads
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='scraper-search')
+fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='scraper-fetch')
+
+
+class HostThrottle:
     """
-    Intelligently fetch and clean the main content from a URL.
+    Per-host politeness limiter: caps concurrent requests to a host and spaces
+    out their start times, without slowing down requests to other hosts.
     """
-    headers = load_random_headers()
-    try:
-        # Use a session for better connection management
-        with requests.Session() as s:
-            resp = s.get(url, headers=headers, timeout=15)
-            resp.raise_for_status()
 
-        soup = BeautifulSoup(resp.text, "html.parser")
-
-        # Remove irrelevant parts of the page
-        for element in soup(["script", "style", "header", "footer", "nav", "aside", "form", "button"]):
-            element.decompose()
-        for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
-            comment.extract()
-
-        # Try to find the main content of the article
-        main_content_selectors = ["article", "main", ".post-content", ".entry-content", "#content", "#main",
-                                  ".td-post-content"]
-        content_div = None
-        for selector in main_content_selectors:
-            content_div = soup.select_one(selector)
-            if content_div:
-                break
+    def __init__(self, limit=PER_HOST_LIMIT, delay=PER_HOST_DELAY):
+        self.limit = limit
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_slot = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self._semaphores[host]
+
+    def acquire(self, host, delay=None, timeout=None):
+        """Waits for a free slot on `host`; returns False if `timeout` runs out first."""
+        sem = self._semaphore(host)
+        if not sem.acquire(timeout=timeout):
+            return False
+
+        gap = self.delay if delay is None else delay
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = start + gap
+        if start > now:
+            time.sleep(start - now)
+        return True
+
+    def release(self, host):
+        self._semaphores[host].release()
 
-        if not content_div:
-            content_div = soup.body  # Fallback to the whole body
 
-        if content_div:
-            full_text = " ".join(clean_text(text) for text in content_div.stripped_strings)
-        else:
-            full_text = ""
+host_throttle = HostThrottle()
 
-        sleep(delay)  # Be polite to servers
-        return full_text
+# --- Result caches ---
+# query -> candidate results per engine, and URL -> cleaned page text/title.
+# Only successful lookups are stored, so transient failures are retried next time.
+search_cache = TTLCache('search', ttl=24 * 3600, max_memory_entries=256, max_disk_bytes=8 * 1024 * 1024)
+page_cache = TTLCache('page', ttl=7 * 24 * 3600, max_memory_entries=512, max_disk_bytes=128 * 1024 * 1024)
 
+
+def cache_stats():
+    """Hit/miss counters for the scraper caches."""
+    return {'search': search_cache.stats(), 'page': page_cache.stats()}
+
+
+def _cache_lookup_counts():
+    counts = {}
+    for cache, stats in cache_stats().items():
+        counts[(cache, 'memory_hit')] = stats['hits_memory']
+        counts[(cache, 'disk_hit')] = stats['hits_disk']
+        counts[(cache, 'miss')] = stats['misses']
+    return counts
+
+
+registry.callback("coin_scraper_cache_lookups_total", "Scraper cache lookups by cache and outcome.", "counter",
+                  ["cache", "result"], _cache_lookup_counts)
+
+
+def fetch_page(url, delay=None, timeout=15):
+    """
+    Fetch a URL once and return its cleaned main content and <title>.
+    Requests to the same host are rate-limited by `host_throttle`; `delay`
+    overrides the per-host gap for this request.
+
+    The body is streamed and parsed as it arrives: non-HTML responses are
+    dropped after the headers, and reading stops at MAX_PAGE_BYTES or once
+    enough text has been extracted.
+    """
+    cached = page_cache.get(url)
+    if cached is not None:
+        return cached
+
+    host = urlparse(url).netloc
+    with span("scraper.host_wait"):
+        acquired = host_throttle.acquire(host, delay=delay, timeout=timeout)
+    if not acquired:
+        print(f"[Scraper] Timed out waiting for a connection slot to {host}")
+        return {"full_text": "[Error: Could not fetch content due to network issue.]", "title": ""}
+
+    start = time.perf_counter()
+    try:
+        # Shared keep-alive pool: repeat hosts skip DNS/TCP/TLS setup
+        resp = http_get(url, timeout=timeout, stream=True)
+        try:
+            resp.raise_for_status()
+            content_type = resp.headers.get("Content-Type", "")
+            if content_type and content_type.split(";")[0].strip().lower() not in HTML_CONTENT_TYPES:
+                print(f"[Scraper] Skipping {url}: not an HTML page ({content_type})")
+                return {"full_text": "[Error: Not an HTML page.]", "title": ""}
+            header_charset = resp.encoding if "charset" in content_type.lower() else None
+            # Closing the response (rather than draining it) hands the connection back without reading the rest
+            page, parse_seconds = _extract_chunks(resp.iter_content(STREAM_CHUNK_BYTES), header_charset)
+        finally:
+            resp.close()
     except requests.RequestException as e:
         print(f"[Scraper] Network error fetching {url}: {e}")
-        return f"[Error: Could not fetch content due to network issue.]"
+        return {"full_text": "[Error: Could not fetch content due to network issue.]", "title": ""}
     except Exception as e:
         print(f"[Scraper] Error processing {url}: {e}")
-        return f"[Error: Could not process the page content.]"
+        return {"full_text": "[Error: Could not process the page content.]", "title": ""}
+    finally:
+        host_throttle.release(host)
+
+    # Download and parsing interleave; report them as the two stages they used to be
+    record("scraper.fetch", time.perf_counter() - start - parse_seconds)
+    record("scraper.parse", parse_seconds)
+    page_cache.set(url, page)
+    return page
+
+
+# Subtrees dropped while parsing, and where the main content usually lives (first match wins, in this order)
+SKIPPED_TAGS = frozenset(["script", "style", "header", "footer", "nav", "aside", "form", "button"])
+MAIN_CONTENT_SELECTORS = [("tag", "article"), ("tag", "main"), ("class", "post-content"), ("class", "entry-content"),
+                          ("id", "content"), ("id", "main"), ("class", "td-post-content")]
+# Tags allowed in <head>; any other start tag implicitly ends it (HTML5 lets pages omit </head>)
+HEAD_TAGS = frozenset(["title", "meta", "link", "style", "script", "base", "noscript", "template"])
+VOID_TAGS = frozenset(["area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param",
+                       "source", "track", "wbr"])
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
 
 
-def is_content_relevant(text, threshold=3):
+class _ContentExtractor(HTMLParser):
     """
-    Check if the text contains enough coin-related keywords to be considered relevant.
+    Incremental main-content extractor, fed the page as it downloads.
+
+    Builds no tree: text outside SKIPPED_TAGS subtrees and <head> goes into one
+    list, and each MAIN_CONTENT_SELECTORS container remembers the slice of that
+    list it spans. Collection stops after a few times `max_chars`, so a huge
+    page costs no more than the part that can still matter.
     """
-    if not text:
-        return False
 
-    text_lower = text.lower()
-    found_keywords = 0
-    for keyword in COIN_KEYWORDS:
-        if keyword in text_lower:
-            found_keywords += 1
+    def __init__(self, max_chars=MAX_TEXT_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self._budget = max_chars * 4
+        self._chars = 0
+        self._pieces = []
+        self._containers = {}  # selector index -> [first piece, end piece or None while open]
+        self._stack = []       # (tag, skipped, selector indices opened by this element)
+        self._skip_depth = 0
+        self._head_depth = 0
+        self._title = None     # pieces of the first <title>, once seen
+        self._in_title = False
+        self._pending = []     # text since the last tag; a chunk boundary can split it
+
+    @property
+    def full(self):
+        return self._chars >= self._budget
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if self._head_depth and tag not in HEAD_TAGS:
+            self._close_from(min(i for i, entry in enumerate(self._stack) if entry[0] == "head"))
+        if tag in VOID_TAGS:
+            return
+        if tag == "title" and self._title is None:
+            self._title, self._in_title = [], True
+
+        skipped = tag in SKIPPED_TAGS
+        opened = []
+        if not skipped and not self._skip_depth:
+            attrs = dict(attrs)
+            classes = (attrs.get("class") or "").split()
+            for i, (kind, name) in enumerate(MAIN_CONTENT_SELECTORS):
+                if i in self._containers:
+                    continue
+                if ((kind == "tag" and tag == name) or (kind == "id" and attrs.get("id") == name)
+                        or (kind == "class" and name in classes)):
+                    self._containers[i] = [len(self._pieces), None]
+                    opened.append(i)
+        self._skip_depth += skipped
+        self._head_depth += tag == "head"
+        self._stack.append((tag, skipped, opened))
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag == "title":
+            self._in_title = False
+        # Close the innermost open element of this name, and anything left unclosed inside it
+        for depth in range(len(self._stack) - 1, -1, -1):
+            if self._stack[depth][0] == tag:
+                self._close_from(depth)
+                return
+
+    def _close_from(self, depth):
+        """Closes the open element at `depth` in the stack and everything nested inside it."""
+        while len(self._stack) > depth:
+            closed, skipped, opened = self._stack.pop()
+            self._skip_depth -= skipped
+            self._head_depth -= closed == "head"
+            self._in_title = self._in_title and closed != "title"
+            for i in opened:
+                self._containers[i][1] = len(self._pieces)
+
+    def handle_data(self, data):
+        self._pending.append(data)
+
+    def handle_comment(self, data):
+        self._flush()
 
-    return found_keywords >= threshold
+    def _flush(self):
+        if not self._pending:
+            return
+        data = "".join(self._pending)
+        self._pending.clear()
+        if self._in_title:
+            self._title.append(data)
+            return
+        if self._skip_depth or self._head_depth or self.full:
+            return
+        text = clean_text(data)
+        if text:
+            self._pieces.append(text)
+            self._chars += len(text) + 1
 
+    def close(self):
+        super().close()
+        self._flush()
 
-def multi_search_snippets(query, max_results=3):
+    def page(self):
+        pieces = self._pieces
+        if self._containers:
+            start, end = self._containers[min(self._containers)]
+            pieces = pieces[start:end]
+        return {"full_text": " ".join(pieces)[:self.max_chars],
+                "title": clean_text("".join(self._title)) if self._title else ""}
+
+
+def _page_encoding(head, header_charset=None):
+    """Charset from the Content-Type header, else a BOM or <meta> tag at the top of the page, else UTF-8."""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    candidates = [header_charset]
+    match = _META_CHARSET.search(head[:4096])
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+    for name in candidates:
+        if not name:
+            continue
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+
+def _extract_chunks(chunks, header_charset=None, max_bytes=MAX_PAGE_BYTES, max_chars=MAX_TEXT_CHARS):
     """
-    Search multiple engines, fetch full content, verify relevance, and return the best results.
+    Parses an HTML body from an iterable of byte chunks, stopping after
+    `max_bytes` or once the extractor has enough text.
+    Returns (page dict, seconds spent decoding and parsing).
     """
-    all_results = []
-    urls_seen = set()
+    extractor = _ContentExtractor(max_chars)
+    decoder = None
+    received = 0
+    parse_seconds = 0.0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        chunk = chunk[:max_bytes - received]
+        received += len(chunk)
+        t0 = time.perf_counter()
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder(_page_encoding(chunk, header_charset))(errors="replace")
+        extractor.feed(decoder.decode(chunk))
+        parse_seconds += time.perf_counter() - t0
+        if received >= max_bytes or extractor.full:
+            break
+
+    t0 = time.perf_counter()
+    if decoder is not None:
+        extractor.feed(decoder.decode(b"", final=True))
+    extractor.close()
+    page = extractor.page()
+    return page, parse_seconds + time.perf_counter() - t0
 
-    # --- Search Google ---
+
+def fetch_full_text(url, delay=1):
+    """
+    Intelligently fetch and clean the main content from a URL.
+    """
+    return fetch_page(url, delay=delay)["full_text"]
+
+
+@lru_cache(maxsize=256)
+def _compile_terms(terms):
+    # Longest first, so a term wins over a shorter term that is a prefix of it
+    alternatives = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternatives})")
+
+
+def _query_terms(query):
+    """Distinctive words of a search query, minus those the coin vocabulary already covers."""
+    terms = []
+    for word in re.findall(r"[^\W\d_]{3,}", query.lower()):
+        if word in QUERY_STOPWORDS or word in terms:
+            continue
+        if any(word.startswith(keyword) for keyword in COIN_KEYWORD_WEIGHTS):
+            continue
+        terms.append(word)
+    return terms
+
+
+class RelevanceScorer:
+    """
+    Weighted term-frequency relevance of page text to coins and to one query.
+
+    All terms (the coin vocabulary plus the query's own words) are combined
+    into a single precompiled regex, so each page is scanned once. The score
+    sums weight x (1 + log tf) over matched terms, so repeating a term helps
+    with diminishing returns and long pages don't win by length alone.
+    """
+
+    def __init__(self, query=""):
+        self.weights = dict(COIN_KEYWORD_WEIGHTS)
+        self.query_terms = _query_terms(query)
+        for term in self.query_terms:
+            self.weights[term] = QUERY_TERM_WEIGHT
+        self._pattern = _compile_terms(tuple(sorted(self.weights)))
+
+    def score(self, text):
+        """Returns (score, number of distinct coin keywords found)."""
+        if not text:
+            return 0.0, 0
+        counts = Counter(self._pattern.findall(text.lower()))
+        score = sum(self.weights[term] * (1 + math.log(tf)) for term, tf in counts.items())
+        keywords = sum(1 for term in counts if term in COIN_KEYWORD_WEIGHTS)
+        return score, keywords
+
+
+_default_scorer = RelevanceScorer()
+
+
+def is_content_relevant(text, threshold=RELEVANCE_THRESHOLD):
+    """
+    Check if the text contains enough coin-related keywords to be considered relevant.
+
+    Keywords match at the start of a word ("coins", "minted"), not anywhere
+    inside one: "irreversible" no longer counts as "reverse", nor "smoking"
+    as "king".
+    """
+    return _default_scorer.score(text)[1] >= threshold
+
+
+def _search_google(query, max_results):
     print(f"[Scraper] Searching Google for: '{query}'")
+    results = []
     try:
         for url in google_search(query, num_results=max_results, sleep_interval=2):
-            if url not in urls_seen:
-                all_results.append({"link": url, "engine": "Google", "title": "", "snippet": ""})
-                urls_seen.add(url)
+            results.append({"link": url, "engine": "Google", "title": "", "snippet": ""})
     except Exception as e:
         print(f"[Scraper] Google search failed: {e}")
+    return results
 
-    # --- Search DuckDuckGo ---
+
+def _search_duckduckgo(query, max_results):
     print(f"[Scraper] Searching DuckDuckGo for: '{query}'")
+    results = []
     try:
         with DDGS() as ddgs:
             for r in ddgs.text(query, max_results=max_results):
                 url = r.get("href")
-                if url and url not in urls_seen:
-                    all_results.append({
+                if url:
+                    results.append({
                         "link": url,
                         "engine": "DuckDuckGo",
                         "title": clean_text(r.get("title", "")),
                         "snippet": clean_text(r.get('body', ''))
                     })
-                    urls_seen.add(url)
     except Exception as e:
         print(f"[Scraper] DuckDuckGo search failed: {e}")
+    return results
 
-    # --- Process and Verify Results ---
-    final_results = []
-    print(f"[Scraper] Found {len(all_results)} total initial results. Fetching and verifying content...")
 
-    for result in all_results:
-        link = result.get("link")
-        if not link:
-            continue
+SEARCH_PROVIDERS = [_search_google, _search_duckduckgo]
+
+
+def _cached_search(provider, query, max_results):
+    key = f"{provider.__name__}:{max_results}:{query}"
+    results = search_cache.get(key)
+    if results is None:
+        with span(f"scraper.search.{provider.__name__.replace('_search_', '')}"):
+            results = provider(query, max_results)
+        if results:
+            search_cache.set(key, results)
+    # Callers annotate results in place, so never hand out the cached objects
+    return [dict(r) for r in results]
+
+
+def _iter_relevant_pages(query, per_engine, deadline, scorer, settle=None):
+    """
+    Yields (result, score, rank) for each candidate page that passes the
+    relevance threshold, in the order its fetch completes.
+
+    Both engines are queried at once and candidate pages are fetched
+    concurrently as soon as each engine answers. `rank` is the candidate's
+    (engine, position) among the search results, used to break score ties
+    deterministically. Stops once every candidate is fetched or `deadline`
+    seconds have passed; closing the generator cancels fetches not yet started.
+    With `settle=(count, grace)`, the deadline is brought forward to `grace`
+    seconds after the `count`-th relevant page.
+    """
+    start = time.monotonic()
+    end = start + deadline
+    ranks = {}
+    accepted = 0
+
+    # in_context: spans on the pool threads still count towards the calling request's timing breakdown
+    provider_futures = {search_pool.submit(in_context(_cached_search), provider, query, per_engine): engine
+                        for engine, provider in enumerate(SEARCH_PROVIDERS)}
+    fetch_futures = {}
+    pending = set(provider_futures)
+
+    try:
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                print(f"[Scraper] Stopped fetching after {time.monotonic() - start:.1f}s with {accepted} relevant results.")
+                break
 
-        print(f"  -> Fetching: {link}")
-        full_text = fetch_full_text(link)
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in provider_futures:
+                    engine = provider_futures[future]
+                    for position, result in enumerate(future.result()):
+                        link = result["link"]
+                        if link in ranks:
+                            # Found by both engines: keep the better placement for tie-breaking
+                            ranks[link] = min(ranks[link], (engine, position))
+                            continue
+                        ranks[link] = (engine, position)
+                        print(f"  -> Fetching: {link}")
+                        fetch_timeout = max(1, min(15, end - time.monotonic()))
+                        fetch_future = fetch_pool.submit(in_context(fetch_page), link, None, fetch_timeout)
+                        fetch_futures[fetch_future] = result
+                        pending.add(fetch_future)
+                    continue
 
-        if is_content_relevant(full_text):
-            print("     -> Content is RELEVANT.")
-            # If Google result, we need to get the title now
-            if not result['title']:
-                try:
-                    soup = BeautifulSoup(requests.get(link, headers=load_random_headers()).text, 'html.parser')
-                    result['title'] = clean_text(soup.title.string) if soup.title else "No Title Found"
-                except:
-                    result['title'] = "No Title Found"
+                result = fetch_futures[future]
+                page = future.result()
+                with span("scraper.score"):
+                    score, keywords = scorer.score(page["full_text"])
+                if keywords < RELEVANCE_THRESHOLD:
+                    print(f"     -> NOT RELEVANT, discarding: {result['link']}")
+                    continue
 
-            result['full_text'] = full_text
-            final_results.append(result)
-        else:
-            print("     -> Content is NOT RELEVANT. Discarding.")
+                print(f"     -> RELEVANT (score {score:.1f}): {result['link']}")
+                # Google results carry no title; use the one parsed from the page itself
+                if not result['title']:
+                    result['title'] = page["title"] or "No Title Found"
+                result['full_text'] = page["full_text"]
+                result['relevance'] = round(score, 2)
+                accepted += 1
+                if settle and accepted == settle[0]:
+                    end = min(end, time.monotonic() + settle[1])
+                yield result, score, ranks[result["link"]]
+    finally:
+        # Runs on exhaustion and when a consumer stops early (e.g. client disconnect):
+        # don't start fetches nobody is waiting for any more
+        for future in pending:
+            future.cancel()
 
-    # Randomly shuffle to mix results from different engines
-    random.shuffle(final_results)
-    return final_results[:max_results]  # Return the best N results
 
+def iter_search_results(query, max_results=3, deadline=SEARCH_DEADLINE):
+    """
+    Search multiple engines and yield each verified result as soon as its page
+    has been fetched and judged relevant.
+
+    Stops after `max_results` relevant pages or once `deadline` seconds have
+    passed, whichever comes first. Results arrive in fetch order; use
+    multi_search_snippets for the best-ranked ones.
+    """
+    pages = _iter_relevant_pages(query, max_results, deadline, RelevanceScorer(query))
+    try:
+        for accepted, (result, _, _) in enumerate(pages, 1):
+            yield result
+            if accepted >= max_results:
+                break
+    finally:
+        pages.close()
+
+
+def multi_search_snippets(query, max_results=3, deadline=SEARCH_DEADLINE):
+    """
+    Search multiple engines, fetch full content, verify relevance, and return the best results.
+
+    Candidates are ranked by RelevanceScorer (coin vocabulary plus the query's
+    own words, e.g. the predicted ruler), ties broken by search-engine
+    placement, so the same pages always come back in the same order. Fetching
+    stops early once `max_results` pages score at least STRONG_MATCH_SCORE, and
+    at most RANKING_GRACE seconds after the first `max_results` relevant pages:
+    compared with returning the first relevant pages, a call costs up to that
+    much extra latency in exchange for the chance of a better-ranked page.
+    """
+    scorer = RelevanceScorer(query)
+    ranked = []
+    strong = 0
+    with span("scraper.total"):
+        pages = _iter_relevant_pages(query, max_results * CANDIDATES_PER_ENGINE, deadline, scorer,
+                                     settle=(max_results, RANKING_GRACE))
+        try:
+            for result, score, rank in pages:
+                ranked.append((-score, rank, result))
+                if score >= STRONG_MATCH_SCORE:
+                    strong += 1
+                    if strong >= max_results:
+                        break
+        finally:
+            pages.close()
+
+    ranked.sort(key=lambda item: item[:2])
+    return [result for _, _, result in ranked[:max_results]]  # Return the best N results
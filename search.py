@@ -0,0 +1,128 @@
+from bisect import bisect_left
+
+from sqlalchemy import or_, inspect
+from . import db
+from .models import (
+    AncientDynastyKey, AncientCoinData,
+    MedievalDynastyKey, MedievalCoinData,
+    ModernDynastyKey, ModernCoinData
+)
+from .image_finder import find_image_path
+from .fulltext import catalogue_index
+from .metrics import span
+
+MODEL_MAP = {
+    'ancient': {'keys': AncientDynastyKey, 'data': AncientCoinData},
+    'medieval': {'keys': MedievalDynastyKey, 'data': MedievalCoinData},
+    'modern': {'keys': ModernDynastyKey, 'data': ModernCoinData}
+}
+
+# Prefix filters OR-ed into a single coin query; keeps statements a sane size
+PREFIX_CHUNK_SIZE = 500
+
+# Table names present in the database, filled once at startup by refresh_table_cache()
+_existing_tables = None
+
+
+def refresh_table_cache():
+    """Reads the database's table list once so searches don't hit inspect() per request."""
+    global _existing_tables
+    _existing_tables = set(inspect(db.engine).get_table_names())
+    return _existing_tables
+
+
+def table_exists(table_name):
+    if _existing_tables is None:
+        refresh_table_cache()
+    return table_name in _existing_tables
+
+
+def _coins_for_keys(DataModel, keys):
+    """
+    Fetches every coin whose code starts with one of the keys' codes using a
+    handful of index-friendly prefix queries, then groups them per key.
+    """
+    prefixes = sorted({key.code for key in keys if key.code})
+    coins = []
+    for i in range(0, len(prefixes), PREFIX_CHUNK_SIZE):
+        chunk = prefixes[i:i + PREFIX_CHUNK_SIZE]
+        with span("db.coins"):
+            coins.extend(
+                DataModel.query
+                .filter(or_(*[DataModel.code.startswith(prefix) for prefix in chunk]))
+                .all()
+            )
+
+    # Overlapping prefixes in different chunks can return the same coin twice.
+    # Sorted by code, all coins sharing a prefix then form one contiguous run.
+    coins = sorted({coin.s_no: coin for coin in coins}.values(), key=lambda coin: coin.code or '')
+    codes = [coin.code or '' for coin in coins]
+    grouped = {}
+    for prefix in prefixes:
+        matches = []
+        for i in range(bisect_left(codes, prefix), len(codes)):
+            if not codes[i].startswith(prefix):
+                break
+            matches.append(coins[i])
+        grouped[prefix] = matches
+    return grouped
+
+
+def build_fulltext_index():
+    """Builds the in-process full-text index and subscribes it to catalogue changes."""
+    catalogue_index.build(MODEL_MAP, table_exists=table_exists)
+    catalogue_index.register_listeners(MODEL_MAP)
+
+
+def search_catalogue(query, with_images=True, limit=None):
+    """
+    Searches the coin catalogue across all periods.
+
+    With the full-text index built, matches dynasty, king name and details
+    (word prefixes, diacritics folded) and ranks results by BM25. Otherwise
+    falls back to SQL: dynasty/king LIKE matching, one key query per period
+    plus one coin query per PREFIX_CHUNK_SIZE matched keys.
+    """
+    search_terms = query.split()
+    if not search_terms:
+        return []
+
+    if catalogue_index.ready:
+        db_results = []
+        with span("search.fulltext"):
+            matches = catalogue_index.search(query, limit=limit)
+        for coin_dict, score in matches:
+            coin_dict['score'] = round(score, 4)
+            if with_images:
+                coin_dict['image_url'] = find_image_path(coin_dict)
+            db_results.append(coin_dict)
+        return db_results
+
+    db_results = []
+    for period, models in MODEL_MAP.items():
+        KeyModel, DataModel = models['keys'], models['data']
+        if not table_exists(KeyModel.__tablename__) or not table_exists(DataModel.__tablename__):
+            continue
+
+        print(f"[Database] Searching in '{period}' tables...")
+        dynasty_query_filters = [
+            or_(KeyModel.dynasty.like(f'%{term}%'), KeyModel.king_name.like(f'%{term}%'))
+            for term in search_terms
+        ]
+        with span("db.keys"):
+            matched_keys = KeyModel.query.filter(or_(*dynasty_query_filters)).order_by(KeyModel.id).all()
+
+        if not matched_keys:
+            print(f"[Database] No matching keys found in '{period}' tables for this query.")
+            continue
+
+        coins_by_prefix = _coins_for_keys(DataModel, matched_keys)
+        for key in matched_keys:
+            for coin in coins_by_prefix.get(key.code, []):
+                coin_dict = coin.to_dict_with_key_info(key)
+                coin_dict['period'] = period
+                if with_images:
+                    coin_dict['image_url'] = find_image_path(coin_dict)
+                db_results.append(coin_dict)
+
+    return db_results[:limit] if limit else db_results
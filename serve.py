@@ -0,0 +1,164 @@
+"""
+Production launcher: pre-fork gunicorn workers sharing one loaded model.
+
+    python serve.py --workers 4 [--threads 16] [--bind 0.0.0.0:8080] [--torch-threads N]
+
+The master builds the app and the Predictor (weights memory-mapped from
+model.pth, see Predictor._load_eager_model) before forking, so all workers share
+the same model pages copy-on-write instead of each loading DenseNet121.
+Nothing runs a forward pass before the fork (OpenMP thread pools do not survive
+it). Each worker then:
+  * caps torch's intra-op threads to cores / workers and inter-op threads to 1,
+    so N workers don't oversubscribe the CPU;
+  * drops database connections inherited from the master;
+  * warms the model up and starts its own micro-batching thread.
+
+The master polls model.pth. When a new checkpoint lands (train.py / push.py
+replace it atomically), it loads the new weights and restarts the workers one
+at a time. Each old worker finishes its in-flight requests first (gunicorn's
+graceful timeout) while the rest keep serving.
+
+Needs fork(), so Linux/macOS only; on Windows use run.py.
+"""
+import argparse
+import gc
+import os
+import signal
+import threading
+import time
+
+import torch
+from gunicorn.app.base import BaseApplication
+
+from ai_model.coin_classifier import Config
+from ai_model.predictor import file_version
+from src import create_app, db, routes
+from src.jobs import job_queue
+
+MODEL_WATCH_INTERVAL = 5       # Seconds between model.pth checks in the master
+WORKER_ROTATE_TIMEOUT = 120    # Max seconds to wait for one worker to be replaced during a reload
+
+
+def torch_threads_per_worker(workers):
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def watched_model_path():
+    """The artifact Predictor loads for the configured backend."""
+    cfg = Config()
+    return {"torchscript": cfg.torchscript_path, "onnx": cfg.onnx_path}.get(cfg.inference_backend, cfg.save_path)
+
+
+class ProductionServer(BaseApplication):
+    """gunicorn with the already-built Flask app, configured from code instead of a config file."""
+
+    def __init__(self, app, options, torch_threads):
+        self.application = app
+        self.options = options
+        self.torch_threads = torch_threads
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set("when_ready", self.when_ready)
+        self.cfg.set("post_fork", self.post_fork)
+        self.cfg.set("post_worker_init", self.post_worker_init)
+
+    def load(self):
+        return self.application
+
+    # --- Master hooks ---
+    def when_ready(self, server):
+        # Objects allocated so far (app, catalogue index, model) are never collected: freezing them keeps
+        # the GC from writing to their pages in the workers, which would un-share them
+        gc.freeze()
+        path = watched_model_path()
+        threading.Thread(target=self._watch_model, args=(server, path), name="model-watch", daemon=True).start()
+
+    def _watch_model(self, server, path):
+        version = file_version(path)
+        while True:
+            time.sleep(MODEL_WATCH_INTERVAL)
+            current = file_version(path)
+            if current is None or current == version:
+                continue
+            # Wait one more interval so a checkpoint copied in (rather than renamed) is complete
+            time.sleep(MODEL_WATCH_INTERVAL)
+            if file_version(path) != current:
+                continue
+
+            version = current
+            print(f"[Serve] {path} changed; loading the new model in the master.")
+            # Let the old model be collected once it is replaced, then re-freeze for the next forks
+            gc.unfreeze()
+            loaded = routes.preload_predictor()
+            gc.collect()
+            gc.freeze()
+            if not loaded:
+                print("[Serve] New model failed to load; workers keep serving the previous one.")
+                continue
+            self._rotate_workers(server)
+
+    def _rotate_workers(self, server):
+        """Gracefully restarts workers one by one; the arbiter forks each replacement from the updated master."""
+        for pid in list(server.WORKERS):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                continue
+            deadline = time.monotonic() + WORKER_ROTATE_TIMEOUT
+            while time.monotonic() < deadline and (pid in server.WORKERS or len(server.WORKERS) < server.num_workers):
+                time.sleep(0.2)
+        print("[Serve] All workers now serve the new model.")
+
+    # --- Worker hooks ---
+    def post_fork(self, server, worker):
+        torch.set_num_threads(self.torch_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Only settable before torch's inter-op pool has started in this process
+            pass
+        # Pooled MySQL connections opened by the master at start-up must not be shared across processes
+        with self.application.app_context():
+            db.engine.dispose(close=False)
+
+    def post_worker_init(self, worker):
+        routes.warm_up_predictor(background=False)
+        job_queue.resume()
+        print(f"[Serve] Worker {os.getpid()} ready ({torch.get_num_threads()} torch threads).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bind", default="0.0.0.0:8080")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads", type=int, default=Config().max_batch_size,
+                        help="Request threads per worker (default: enough to fill one micro-batch); "
+                             "concurrent uploads in one worker share forward passes")
+    parser.add_argument("--torch-threads", type=int, help="Intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--timeout", type=int, default=120)
+    parser.add_argument("--proxy-hops", type=int,
+                        help="Reverse proxies in front of the server whose X-Forwarded-For is trusted "
+                             "(default: COIN_PROXY_HOPS, else 0)")
+    args = parser.parse_args()
+
+    app = create_app(model_warm_up="preload", proxy_hops=args.proxy_hops)
+    options = {
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        "worker_class": "gthread",
+        "timeout": args.timeout,
+        "graceful_timeout": args.timeout,
+        "preload_app": True,
+    }
+    torch_threads = args.torch_threads or torch_threads_per_worker(args.workers)
+    print(f"[Serve] {args.workers} workers x {args.threads} threads, {torch_threads} torch threads each, "
+          f"on {args.bind}")
+    ProductionServer(app, options, torch_threads).run()
+
+
+if __name__ == "__main__":
+    main()
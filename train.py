@@ -0,0 +1,374 @@
+"""
+Train ProtoPNet on the dataset folders from Config.
+
+    python -m ai_model.train [--epochs 25] [--resume] [--compile] [--no-amp] [--workers 8] [--accum 2]
+
+Training follows Config: for the first `freeze_epochs` the DenseNet encoder is
+frozen (and kept in eval mode so its BatchNorm statistics stay put) while the
+projection, prototypes and last layer warm up; after that everything trains
+jointly. Each of those parameter groups has its own learning rate
+(lr_features / lr_prototypes / lr_last_layer) within one optimizer.
+
+Speed-related settings (all on Config, overridable here):
+  * bf16 autocast on CPU (fp16 + GradScaler on CUDA) and channels_last inputs,
+    which is what oneDNN's fast convolution kernels want;
+  * optional torch.compile, falling back to eager if it is unavailable;
+  * DataLoader workers / pinning / prefetch; packed shards (feature_shards.py)
+    are used instead of per-file .pt samples when present;
+  * gradient accumulation to keep the effective batch size on small machines;
+  * --cached-features trains only the prototypes and last layer on backbone
+    features from extract_features.py, so the DenseNet never runs at all.
+
+Model inputs for end-to-end training come from Config.<split>_dir when it
+exists: ProtoFeatureDataset folders of .pt tensors, each already a
+[input_channels, image_size, image_size] model input (the shape is checked
+before training starts). Otherwise raw images in Config.image_dir/<split>/<class>/
+are decoded with ImagePreprocessor, exactly as Predictor decodes uploads.
+
+The loop checkpoints optimizer and scaler state after every epoch to
+Config.train_state_path (--resume continues from it) and writes the best
+weights by validation accuracy to Config.save_path, which Predictor loads.
+"""
+import argparse
+import contextlib
+import functools
+import os
+import time
+
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset
+
+from .coin_classifier import Config, ProtoFeatureDataset, ProtoPNet
+from .extract_features import backbone_fingerprint, backbone_source, list_images, read_stamp
+from .feature_shards import INDEX_FILE, ShardedFeatureDataset
+from .predictor import load_checkpoint
+from .preprocessing import ImagePreprocessor
+
+
+# ============================================================
+# DATA
+# ============================================================
+class ImageFolderDataset(Dataset):
+    """Raw images in <root>/<class>/<image>, decoded to model inputs with ImagePreprocessor."""
+
+    def __init__(self, root_dir, cfg):
+        self.root_dir = root_dir
+        self.cfg = cfg
+        self.classes = sorted(d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d)))
+        class_to_idx = {c: i for i, c in enumerate(self.classes)}
+        self.samples = [(path, class_to_idx[cls]) for cls, path in list_images(root_dir)]
+        self._preprocessor = None
+
+    def __getstate__(self):
+        # DataLoader workers build their own preprocessor (it owns a thread pool)
+        state = self.__dict__.copy()
+        state["_preprocessor"] = None
+        return state
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        if self._preprocessor is None:
+            self._preprocessor = ImagePreprocessor(self.cfg, workers=1)
+        path, label = self.samples[idx]
+        with open(path, "rb") as f:
+            return self._preprocessor.preprocess(f.read()), label
+
+
+def split_dirs(cfg, split, cached_features=False):
+    """
+    (per-sample folder, packed shard folder) for a split's model inputs or
+    cached backbone features. Model inputs fall back to the raw image folder
+    when there is no prepared-tensor folder.
+    """
+    if cached_features:
+        return os.path.join(cfg.feature_dir, split), os.path.join(cfg.shard_dir, "features", split)
+    folder = getattr(cfg, f"{split}_dir")
+    if not os.path.isdir(folder) and os.path.isdir(os.path.join(cfg.image_dir, split)):
+        folder = os.path.join(cfg.image_dir, split)
+    return folder, os.path.join(cfg.shard_dir, split)
+
+
+def check_input_shape(dataset, cfg, source):
+    """Fails fast if prepared tensors aren't what the DenseNet encoder takes, instead of mid-epoch."""
+    if len(dataset) == 0:
+        return
+    expected = (cfg.input_channels, cfg.image_size, cfg.image_size)
+    shape = tuple(dataset[0][0].shape)
+    if shape != expected:
+        raise RuntimeError(f"Samples in {source} have shape {shape}, but the model takes {expected} inputs. "
+                           f"Put raw images in {cfg.image_dir}/<split>/<class>/ instead, or use --cached-features "
+                           f"for extract_features.py output.")
+
+
+def open_split(cfg, split, cached_features=False):
+    """Packed shards for `split` if they exist, otherwise the per-sample folder."""
+    folder, shard_dir = split_dirs(cfg, split, cached_features)
+    if os.path.exists(os.path.join(shard_dir, INDEX_FILE)):
+        print(f"[Train] Using packed shards for {split}: {shard_dir}")
+        dataset, source = ShardedFeatureDataset(shard_dir), shard_dir
+    elif not cached_features and folder == os.path.join(cfg.image_dir, split):
+        print(f"[Train] Decoding raw images for {split}: {folder}")
+        return ImageFolderDataset(folder, cfg)
+    else:
+        dataset, source = ProtoFeatureDataset(folder, preload=cfg.preload_data), folder
+    if not cached_features:
+        check_input_shape(dataset, cfg, source)
+    return dataset
+
+
+def check_feature_stamps(cfg, model, splits, source):
+    """Cached features are only valid for the backbone that produced them."""
+    fingerprint = backbone_fingerprint(model)
+    for split in splits:
+        folder, _ = split_dirs(cfg, split, cached_features=True)
+        stamp = read_stamp(folder)
+        if stamp != fingerprint:
+            raise RuntimeError(f"Features in {folder} were extracted with backbone {stamp}, but {source} "
+                               f"has backbone {fingerprint}; re-run extract_features.py")
+
+
+def make_loader(dataset, cfg, shuffle):
+    workers = cfg.num_workers
+    extra = {"prefetch_factor": cfg.prefetch_factor, "persistent_workers": True} if workers > 0 else {}
+    return DataLoader(
+        dataset,
+        batch_size=cfg.batch_size,
+        shuffle=shuffle,
+        num_workers=workers,
+        pin_memory=cfg.device.startswith("cuda"),
+        **extra,
+    )
+
+
+# ============================================================
+# MODEL / OPTIMIZER
+# ============================================================
+def parameter_groups(model, cfg):
+    return [
+        {"name": "encoder", "params": list(model.features.encoder.parameters()), "lr": cfg.lr_features},
+        {"name": "prototypes", "params": list(model.features.project.parameters()) + [model.prototype_vectors],
+         "lr": cfg.lr_prototypes},
+        {"name": "last_layer", "params": list(model.last_layer.parameters()), "lr": cfg.lr_last_layer},
+    ]
+
+
+def set_encoder_frozen(model, frozen):
+    # Frozen parameters get no .grad, so Adam skips them without a separate optimizer per stage
+    model.features.encoder.requires_grad_(not frozen)
+
+
+def autocast(cfg, device):
+    if not cfg.amp:
+        return contextlib.nullcontext()
+    dtype = torch.float16 if device.type == "cuda" else torch.bfloat16
+    return torch.autocast(device_type=device.type, dtype=dtype)
+
+
+def maybe_compile(model, cfg):
+    if not cfg.compile_model:
+        return model
+    if not hasattr(torch, "compile"):
+        print("[Train] torch.compile is not available in this PyTorch; training eagerly.")
+        return model
+    try:
+        return torch.compile(model)
+    except Exception as e:
+        print(f"[Train] torch.compile failed ({e}); training eagerly.")
+        return model
+
+
+def prototype_costs(model, distances, labels):
+    """ProtoPNet cluster cost (pull to own-class prototypes) and separation cost (push from the rest)."""
+    prototype_class = torch.arange(model.P, device=distances.device) // model.k
+    own = prototype_class.unsqueeze(0) == labels.unsqueeze(1)
+    cluster = distances.masked_fill(~own, float("inf")).min(dim=1).values.mean()
+    separation = distances.masked_fill(own, float("inf")).min(dim=1).values.mean()
+    return cluster, separation
+
+
+# ============================================================
+# CHECKPOINTS
+# ============================================================
+def save_atomic(obj, path):
+    # Write-then-rename so readers (Predictor, the prediction cache) never see a half-written file
+    tmp = f"{path}.tmp"
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+
+def save_state(cfg, model, optimizer, scaler, epoch, best_acc, classes):
+    save_atomic({
+        "epoch": epoch,
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "scaler": scaler.state_dict(),
+        "best_acc": best_acc,
+        "classes": classes,
+    }, cfg.train_state_path)
+
+
+def load_state(cfg, model, optimizer, scaler):
+    state = torch.load(cfg.train_state_path, map_location=cfg.device, weights_only=True)
+    model.load_state_dict(state["model"])
+    optimizer.load_state_dict(state["optimizer"])
+    scaler.load_state_dict(state["scaler"])
+    print(f"[Train] Resumed from {cfg.train_state_path} after epoch {state['epoch']}")
+    return state["epoch"], state["best_acc"]
+
+
+# ============================================================
+# LOOPS
+# ============================================================
+def train_one_epoch(epoch, model, forward, loader, optimizer, scaler, cfg, device, frozen):
+    model.train()
+    if frozen:
+        model.features.encoder.eval()
+
+    accum = max(1, cfg.grad_accum_steps)
+    steps = len(loader)
+    total_loss, total_correct, total_seen = 0.0, 0, 0
+    window_seen, window_data, window_start = 0, 0.0, time.perf_counter()
+
+    optimizer.zero_grad(set_to_none=True)
+    fetch_start = time.perf_counter()
+    for step, (x, y) in enumerate(loader, 1):
+        x = x.to(device, non_blocking=True, memory_format=torch.channels_last)
+        y = y.to(device, non_blocking=True)
+        window_data += time.perf_counter() - fetch_start
+
+        with autocast(cfg, device):
+            logits, distances = forward(x)
+            ce = F.cross_entropy(logits.float(), y)
+            cluster, separation = prototype_costs(model, distances.float(), y)
+            loss = ce + cfg.clst_coef * cluster - cfg.sep_coef * separation
+
+        scaler.scale(loss / accum).backward()
+        if step % accum == 0 or step == steps:
+            scaler.step(optimizer)
+            scaler.update()
+            optimizer.zero_grad(set_to_none=True)
+
+        batch = y.shape[0]
+        total_loss += loss.item() * batch
+        total_correct += (logits.argmax(dim=1) == y).sum().item()
+        total_seen += batch
+        window_seen += batch
+
+        if step % cfg.log_interval == 0 or step == steps:
+            elapsed = time.perf_counter() - window_start
+            print(f"[Train] epoch {epoch + 1} step {step}/{steps} loss {loss.item():.4f} "
+                  f"{window_seen / elapsed:.1f} samples/s (data wait {100 * window_data / elapsed:.0f}%)")
+            window_seen, window_data, window_start = 0, 0.0, time.perf_counter()
+        fetch_start = time.perf_counter()
+
+    return total_loss / max(total_seen, 1), total_correct / max(total_seen, 1)
+
+
+def evaluate(model, forward, loader, cfg, device):
+    model.eval()
+    correct, seen = 0, 0
+    with torch.inference_mode(), autocast(cfg, device):
+        for x, y in loader:
+            x = x.to(device, non_blocking=True, memory_format=torch.channels_last)
+            y = y.to(device, non_blocking=True)
+            logits, _ = forward(x)
+            correct += (logits.argmax(dim=1) == y).sum().item()
+            seen += y.shape[0]
+    return correct / max(seen, 1)
+
+
+def train(cfg, resume=False, cached_features=False):
+    device = torch.device(cfg.device)
+    train_set = open_split(cfg, "train", cached_features)
+    val_set = open_split(cfg, "val", cached_features)
+    if len(train_set) == 0:
+        raise RuntimeError(f"No training samples found in {split_dirs(cfg, 'train', cached_features)[0]}")
+    classes = train_set.classes
+
+    train_loader = make_loader(train_set, cfg, shuffle=True)
+    val_loader = make_loader(val_set, cfg, shuffle=False) if len(val_set) else None
+
+    model = ProtoPNet(cfg, len(classes), pretrained_backbone=not cached_features)
+    if cached_features:
+        # The saved model must keep the backbone the features came from, so start from the same weights
+        # extract_features.py used: the trained checkpoint, or its backbone_init.pth start point
+        source = backbone_source(cfg)
+        if not os.path.exists(source):
+            raise RuntimeError(f"--cached-features needs the weights the features were extracted with "
+                               f"({cfg.save_path} or {cfg.backbone_init_path}); run extract_features.py first")
+        model.load_state_dict(load_checkpoint(source))
+        check_feature_stamps(cfg, model, ["train", "val"] if len(val_set) else ["train"], source)
+        model.features.requires_grad_(False)
+    model.to(device, memory_format=torch.channels_last)
+    optimizer = torch.optim.Adam(parameter_groups(model, cfg))
+    scaler = torch.cuda.amp.GradScaler(enabled=cfg.amp and device.type == "cuda")
+
+    start_epoch, best_acc = 0, -1.0
+    if resume and os.path.exists(cfg.train_state_path):
+        start_epoch, best_acc = load_state(cfg, model, optimizer, scaler)
+
+    forward = maybe_compile(model, cfg)
+    if cached_features:
+        forward = functools.partial(forward, from_features=True)
+    print(f"[Train] {len(train_set)} train / {len(val_set)} val samples, {len(classes)} classes, "
+          f"device={device}, amp={cfg.amp}, workers={cfg.num_workers}, accum={cfg.grad_accum_steps}")
+
+    for epoch in range(start_epoch, cfg.epochs):
+        frozen = cached_features or epoch < cfg.freeze_epochs
+        if cached_features:
+            stage = "head only (cached features)"
+        else:
+            set_encoder_frozen(model, frozen)
+            stage = "warm-up (encoder frozen)" if frozen else "joint"
+
+        start = time.perf_counter()
+        loss, train_acc = train_one_epoch(epoch, model, forward, train_loader, optimizer, scaler, cfg,
+                                          device, frozen)
+        val_acc = evaluate(model, forward, val_loader, cfg, device) if val_loader else train_acc
+        elapsed = time.perf_counter() - start
+        print(f"[Train] epoch {epoch + 1}/{cfg.epochs} [{stage}] loss {loss:.4f} train acc {train_acc:.4f} "
+              f"val acc {val_acc:.4f} ({elapsed:.0f}s, {len(train_set) / elapsed:.1f} samples/s)")
+
+        if val_acc > best_acc:
+            best_acc = val_acc
+            save_atomic(model.state_dict(), cfg.save_path)
+            print(f"[Train] New best model saved to {cfg.save_path}")
+        save_state(cfg, model, optimizer, scaler, epoch + 1, best_acc, classes)
+
+    return best_acc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--epochs", type=int)
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--workers", type=int, help="DataLoader worker processes")
+    parser.add_argument("--accum", type=int, help="Gradient accumulation steps")
+    parser.add_argument("--compile", action="store_true", help="Use torch.compile when available")
+    parser.add_argument("--no-amp", action="store_true", help="Train in float32")
+    parser.add_argument("--resume", action="store_true", help="Continue from Config.train_state_path")
+    parser.add_argument("--cached-features", action="store_true",
+                        help="Train prototypes + last layer on Config.feature_dir (see extract_features.py)")
+    args = parser.parse_args()
+
+    cfg = Config()
+    if args.epochs is not None:
+        cfg.epochs = args.epochs
+    if args.batch_size is not None:
+        cfg.batch_size = args.batch_size
+    if args.workers is not None:
+        cfg.num_workers = args.workers
+    if args.accum is not None:
+        cfg.grad_accum_steps = args.accum
+    cfg.compile_model = cfg.compile_model or args.compile
+    cfg.amp = cfg.amp and not args.no_amp
+
+    best = train(cfg, resume=args.resume, cached_features=args.cached_features)
+    print(f"[Train] Done. Best validation accuracy {best:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,77 @@
 import json
 import random
 import os
+import threading
+from functools import lru_cache
+from http.cookiejar import DefaultCookiePolicy
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 
-def load_random_headers():
+# --- Shared HTTP connection pool ---
+HTTP_POOL_HOSTS = 32      # Distinct hosts whose connections are kept alive
+HTTP_POOL_PER_HOST = 4    # Connections per host; extra requests wait for a free one
+HTTP_RETRIES = Retry(
+    total=2,
+    connect=2,
+    read=1,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=("GET", "HEAD"),
+    respect_retry_after_header=True,
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _header_profiles():
     current_dir = os.path.dirname(__file__)
     headers_path = os.path.join(current_dir, "headers.json")
     with open(headers_path, "r") as f:
-        headers_list = json.load(f)
-    return random.choice(headers_list)
+        return tuple(json.load(f))
+
+
+def load_random_headers():
+    # Profiles are parsed once; hand out a copy so callers can tweak it freely
+    return dict(random.choice(_header_profiles()))
+
+
+def get_session():
+    """
+    Returns the process-wide requests.Session used for all outbound scraping.
+    Connections are kept alive and reused per host, idempotent requests are
+    retried with backoff, and cookies are never stored so concurrent threads
+    can't leak state into each other.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_HOSTS,
+                    pool_maxsize=HTTP_POOL_PER_HOST,
+                    pool_block=True,
+                    max_retries=HTTP_RETRIES,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                _session = session
+    return _session
+
+
+def http_get(url, timeout=10, headers=None, **kwargs):
+    """GET through the shared pool with a random browser header profile."""
+    return get_session().get(url, headers=headers or load_random_headers(), timeout=timeout, **kwargs)
+
 
 def fetch_url(url):
-    headers = load_random_headers()
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = http_get(url, timeout=10)
         response.raise_for_status()
         return response.text
     except requests.RequestException as e: